@@ -16,7 +16,7 @@ from owmeta_core.statement import Statement
 # adapter like this to make statements
 class DOAdapter:
     def __init__(self, identifier):
-        self.idl = URIRef(identifier)
+        self.idl = identifier if isinstance(identifier, URIRef) else URIRef(identifier)
 
 
 # This is just how I'm choosing to implement properties, you don't have to use Contexts to
@@ -26,6 +26,11 @@ BASE_SCHEMA_URL = 'http://schema.openworm.org/2020/07'
 BASE_DATA_URL = 'http://data.openworm.org'
 
 # The c extensions are incompatible with our code...
+if 'wrapt' in sys.modules and os.environ.get('WRAPT_DISABLE_EXTENSIONS') != '1':
+    # wrapt only reads this variable when it's first imported, so setting it now is too
+    # late
+    LOGGER.warning('wrapt was imported before owmeta_core, so its C extensions may be'
+            ' in use. Set WRAPT_DISABLE_EXTENSIONS=1 in the environment to disable them.')
 os.environ['WRAPT_DISABLE_EXTENSIONS'] = '1'
 
 
@@ -35,9 +40,6 @@ Base directory in the user's profile for owmeta (e.g., shared configuration, bun
 '''
 
 
-from .configure import Configurable
-from .context import Context, ClassContext
-
 __all__ = [
     "get_data",
     "disconnect",
@@ -45,18 +47,45 @@ __all__ = [
     "Configurable",
 ]
 
-DEF_CTX = Context()
 
-RDF_CONTEXT = ClassContext(ident='http://www.w3.org/1999/02/22-rdf-syntax-ns',
-        base_namespace='http://www.w3.org/1999/02/22-rdf-syntax-ns#')
+def __getattr__(name):
+    # Context and configuration classes, along with the contexts defined below, are
+    # imported on first access: importing them pulls in rdflib, ZODB, and the rest of
+    # the database machinery, which many users of the package (e.g., quick ``owm``
+    # sub-commands) never need.
+    if name == 'Configurable':
+        from .configure import Configurable as res
+    elif name in ('Context', 'ClassContext'):
+        from . import context
+        res = getattr(context, name)
+    elif name in _CONTEXT_NAMES:
+        _init_contexts()
+        return globals()[name]
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = res
+    return res
+
+
+_CONTEXT_NAMES = ('DEF_CTX', 'RDF_CONTEXT', 'RDFS_CONTEXT', 'BASE_CONTEXT')
+
 
-RDFS_CONTEXT = ClassContext(ident='http://www.w3.org/2000/01/rdf-schema',
-        imported=(RDF_CONTEXT,),
-        base_namespace='http://www.w3.org/2000/01/rdf-schema#')
+def _init_contexts():
+    global DEF_CTX, RDF_CONTEXT, RDFS_CONTEXT, BASE_CONTEXT
+    from .context import Context, ClassContext
 
-BASE_CONTEXT = ClassContext(imported=(RDFS_CONTEXT,),
-        ident=BASE_SCHEMA_URL,
-        base_namespace=BASE_SCHEMA_URL + '#')
+    DEF_CTX = Context()
+
+    RDF_CONTEXT = ClassContext(ident='http://www.w3.org/1999/02/22-rdf-syntax-ns',
+            base_namespace='http://www.w3.org/1999/02/22-rdf-syntax-ns#')
+
+    RDFS_CONTEXT = ClassContext(ident='http://www.w3.org/2000/01/rdf-schema',
+            imported=(RDF_CONTEXT,),
+            base_namespace='http://www.w3.org/2000/01/rdf-schema#')
+
+    BASE_CONTEXT = ClassContext(imported=(RDFS_CONTEXT,),
+            ident=BASE_SCHEMA_URL,
+            base_namespace=BASE_SCHEMA_URL + '#')
 
 
 def get_data(path):
@@ -97,6 +126,7 @@ class Connection(object):
         Connection
             connection wrapping the configuration
         """
+        from .context import Context
         from .data import Data, DatabaseConflict
         from .mapper import Mapper
 
@@ -128,7 +158,7 @@ class Connection(object):
 
         self._context = Context(conf=self.conf, mapper=mapper)
 
-        self.identifier = str(uuid.uuid4())
+        self.identifier = uuid.uuid4().hex
         '''
         Identifier for this connection.
 
@@ -137,6 +167,8 @@ class Connection(object):
 
         self.mapper = mapper
 
+        self._str = None
+
     @property
     def rdf(self):
         return self.conf['rdf.graph']
@@ -181,10 +213,16 @@ class Connection(object):
                     ' or subclasses thereof. Received %s' % target)
 
     def __str__(self):
-        conf = self.conf
-        return 'Connection:{source}:{store_conf}'.format(
-                source=conf.get('rdf.source'),
-                store_conf=conf.get('rdf.store_conf', 'default'))
+        # The configuration isn't changed after the connection is made, so we only need
+        # to build the string once
+        res = self._str
+        if res is None:
+            conf = self.conf
+            res = 'Connection:{source}:{store_conf}'.format(
+                    source=conf.get('rdf.source'),
+                    store_conf=conf.get('rdf.store_conf', 'default'))
+            self._str = res
+        return res
 
 
 def disconnect(c=None):
@@ -1,5 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain, islice
+from queue import Queue, Full
+import logging
+import threading
+
 from rdflib import plugin
 from rdflib.store import Store, NO_STORE
+from rdflib.term import URIRef
+
+from .utils import grouper
+
+
+L = logging.getLogger(__name__)
 
 
 class AggregateStore(Store):
@@ -25,9 +38,48 @@ class AggregateStore(Store):
     # after the store is open, so we don't care if we need to change it to `True` later.
     supports_range_queries = False
 
-    def __init__(self, configuration=None, identifier=None, graph_aware=None):
+    def __init__(self, configuration=None, identifier=None, graph_aware=None,
+            max_workers=None, strict_prefix_check=True, deduplicate=False,
+            route_by_predicate=False):
+        '''
+        Parameters
+        ----------
+        configuration : list of tuple or dict, optional
+            Passed to `open`
+        identifier : str, optional
+            Passed to `~rdflib.store.Store`
+        graph_aware : bool, optional
+            Overrides `graph_aware`
+        max_workers : int, optional
+            If given, `open` opens the aggregated stores, and `triples` and
+            `triples_choices` query them, concurrently with up to this many threads. Only
+            use this when all of the aggregated stores can be opened and read from
+            multiple threads. By default, the stores are opened and queried one after
+            another.
+        strict_prefix_check : bool, optional
+            If `True`, the default, `prefix` and `namespace` consult every aggregated
+            store and raise `AggregatedStoresConflict` if they disagree. Otherwise, the
+            first store with an answer wins.
+        deduplicate : bool, optional
+            If `True`, `triples` and `triples_choices` yield a triple found in more than
+            one aggregated store only once, with the contexts from the first store where
+            it was found. Requires memory proportional to the number of distinct triples
+            returned by a query.
+        route_by_predicate : bool, optional
+            If `True`, `triples` and `triples_choices` only query the aggregated stores
+            which have a triple with the pattern's predicate, if it has one. Which stores
+            have a predicate is checked the first time the predicate is queried and then
+            remembered until this store is written to, opened, or closed. Only use this
+            when the aggregated stores are not modified other than through this store.
+        '''
         super(AggregateStore, self).__init__(configuration, identifier)
-        self.__stores = []
+        self.__max_workers = max_workers
+        self.__strict_prefix_check = strict_prefix_check
+        self.__deduplicate = deduplicate
+        self.__route_by_predicate = route_by_predicate
+        self.__executor = None
+        self.__stores = ()
+        self._invalidate()
         self.__bound_ns = dict()
         self.__bound_pref = dict()
         if graph_aware is not None:
@@ -43,81 +95,276 @@ class AggregateStore(Store):
         '''
         Creates and opens all of the stores specified in the configuration
 
-        Also checks for all aggregated stores to be `context_aware`
+        Also checks for all aggregated stores to be `context_aware`. If `max_workers` was
+        given, the stores are opened concurrently. If any store fails to open, the stores
+        which did open are closed again before the exception is raised.
+
+        Parameters
+        ----------
+        configuration : list of tuple or dict
+            Pairs of a store type and the configuration for that store. Alternatively, a
+            dict with those pairs under ``stores`` and, optionally, values for any of
+            ``max_workers``, ``strict_prefix_check``, ``deduplicate``, or
+            ``route_by_predicate``, which replace the values given at initialization
+        create : bool, optional
+            Ignored
         '''
+        if isinstance(configuration, dict):
+            self.__max_workers = configuration.get('max_workers', self.__max_workers)
+            self.__strict_prefix_check = configuration.get('strict_prefix_check',
+                    self.__strict_prefix_check)
+            self.__deduplicate = configuration.get('deduplicate', self.__deduplicate)
+            self.__route_by_predicate = configuration.get('route_by_predicate',
+                    self.__route_by_predicate)
+            configuration = configuration.get('stores')
         if not isinstance(configuration, (tuple, list)):
             return NO_STORE
-        self.__stores = []
+        self.__stores = ()
+        self._invalidate()
+        stores = []
+        confs = []
         for store_key, store_conf in configuration:
-            store = plugin.get(store_key, Store)()
-            store.open(store_conf)
-            self.__stores.append(store)
-        assert self.__stores, 'At least one store configuration must be provided'
-        assert all(x.context_aware for x in self.__stores), ('All aggregated stores must be'
-                                                             ' context_aware')
-        assert self.__stores[0].graph_aware, 'The first store must be graph_aware'
-        self.supports_range_queries = all(getattr(x, 'supports_range_queries', False) for x in self.__stores)
+            stores.append(plugin.get(store_key, Store)())
+            confs.append(store_conf)
+        opened = []
+        try:
+            if self.__max_workers and len(stores) > 1:
+                self._open_concurrently(stores, confs, opened)
+            else:
+                for store, store_conf in zip(stores, confs):
+                    store.open(store_conf)
+                    opened.append(store)
+        except BaseException:
+            for store in opened:
+                try:
+                    store.close()
+                except Exception:
+                    L.warning('Failed to close %s after another store failed to open',
+                            store, exc_info=True)
+            raise
+        self.__stores = tuple(stores)
+        assert stores, 'At least one store configuration must be provided'
+        assert stores[0].graph_aware, 'The first store must be graph_aware'
+        supports_range_queries = True
+        for store in stores:
+            assert store.context_aware, 'All aggregated stores must be context_aware'
+            if not getattr(store, 'supports_range_queries', False):
+                supports_range_queries = False
+        self.supports_range_queries = supports_range_queries
+
+    def _open_concurrently(self, stores, confs, opened):
+        '''
+        Opens the stores on a thread pool, adding each store that opens to `opened`, and
+        raises the first exception from any of them after all have finished
+        '''
+        with ThreadPoolExecutor(max_workers=min(self.__max_workers, len(stores))) as executor:
+            futures = [executor.submit(store.open, store_conf)
+                       for store, store_conf in zip(stores, confs)]
+        error = None
+        for store, future in zip(stores, futures):
+            exc = future.exception()
+            if exc is None:
+                opened.append(store)
+            elif error is None:
+                error = exc
+        if error is not None:
+            raise error
 
     def triples(self, triple, context=None):
-        for store in self.__stores:
-            for trip in store.triples(triple, context=context):
-                yield trip
+        stores = self._stores_for(triple)
+        if len(stores) == 1:
+            return stores[0].triples(triple, context=context)
+        return self._fan_out([partial(store.triples, triple, context=context)
+                              for store in stores])
 
     def triples_choices(self, triple, context=None):
-        for store in self.__stores:
-            for trip in store.triples_choices(triple, context=context):
-                yield trip
+        stores = self._stores_for(triple)
+        if len(stores) == 1:
+            return stores[0].triples_choices(triple, context=context)
+        return self._fan_out([partial(store.triples_choices, triple, context=context)
+                              for store in stores])
+
+    def _stores_for(self, triple):
+        '''
+        Returns the aggregated stores which could have matches for the given triple
+        pattern
+        '''
+        if not self.__route_by_predicate:
+            return self.__stores
+        predicate = triple[1]
+        if not isinstance(predicate, URIRef):
+            return self.__stores
+        routes = self.__predicate_routes
+        stores = routes.get(predicate)
+        if stores is None:
+            stores = routes[predicate] = tuple(store for store in self.__stores
+                                               if _has_predicate(store, predicate))
+        return stores
+
+    def _fan_out(self, queries):
+        if self.__max_workers:
+            res = self._parallel_chain(queries)
+        else:
+            res = chain.from_iterable(query() for query in queries)
+        if self.__deduplicate:
+            res = _unique_triples(res)
+        return res
+
+    def triples_choices_batched(self, queries):
+        '''
+        Runs several `triples_choices` queries, yielding the matches for all of them
+
+        Queries which share a context and differ only in their list of choices are merged
+        into a single `triples_choices` call on each aggregated store, so a match common
+        to merged queries is yielded only once.
+
+        Parameters
+        ----------
+        queries : iterable of tuple
+            Pairs of a triple pattern, with one list of choices in it, and a context, as
+            would be passed to `triples_choices`
+
+        Raises
+        ------
+        ValueError
+            If a triple pattern doesn't have a list of choices in it
+        '''
+        merged = dict()
+        for triple, context in queries:
+            choice_idx = next((i for i, term in enumerate(triple)
+                               if isinstance(term, (list, tuple))), None)
+            if choice_idx is None:
+                raise ValueError(f'Query has no list of choices: {triple!r}')
+            key = (choice_idx,
+                   tuple(term for i, term in enumerate(triple) if i != choice_idx),
+                   context)
+            merged.setdefault(key, dict()).update(dict.fromkeys(triple[choice_idx]))
+
+        for (choice_idx, fixed, context), choices in merged.items():
+            triple = list(fixed)
+            triple.insert(choice_idx, list(choices))
+            yield from self.triples_choices(tuple(triple), context=context)
+
+    def _parallel_chain(self, iterable_factories):
+        '''
+        Yields from the iterables produced by each of `iterable_factories`, each drained on
+        a separate thread. Results are yielded in the order they arrive rather than in
+        store order.
+
+        Workers pass results in batches, so a worker can read ahead of the consumer, and so
+        we synchronize on the queue once per batch rather than once per result.
+
+        Each call gets its own workers: a worker blocks once the consumer falls behind, so
+        workers shared with a query that is suspended (e.g., the outer query of a join)
+        could leave this one waiting forever.
+        '''
+        executor = ThreadPoolExecutor(
+                max_workers=min(self.__max_workers, len(iterable_factories)))
+        results = Queue(maxsize=_PARALLEL_QUEUE_SIZE)
+        stop = threading.Event()
+        for factory in iterable_factories:
+            executor.submit(_drain_into, factory, results, stop)
+        remaining = len(iterable_factories)
+        try:
+            while remaining:
+                item = results.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, _DrainFailure):
+                    raise item.exception
+                else:
+                    yield from item
+        finally:
+            # Tells the workers to stop if we're closed early or fail
+            stop.set()
+            executor.shutdown(wait=False)
 
     def __len__(self, context=None):
         # rdflib specifies a context argument for __len__, but how do you even pass that
         # argument to len?
-        return sum(len(store) for store in self.__stores)
+        stores = self.__stores
+        if self.__max_workers and len(stores) > 1:
+            # Each length may be an expensive count (e.g., a query to a remote endpoint),
+            # so we ask for them concurrently if we're allowed
+            return sum(self._executor().map(len, stores))
+        return sum(len(store) for store in stores)
+
+    def _executor(self):
+        executor = self.__executor
+        if executor is None:
+            executor = self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers)
+        return executor
+
+    def _invalidate(self):
+        '''
+        Clears the predicate routes remembered for ``route_by_predicate``
+        '''
+        self.__predicate_routes = dict()
 
     def contexts(self, triple=None):
+        stores = self.__stores
+        if len(stores) == 1:
+            return stores[0].contexts(triple)
+        return self._unique(chain.from_iterable(store.contexts(triple)
+                                                for store in stores))
+
+    @staticmethod
+    def _unique(iterable):
         seen = set()
-        for store in self.__stores:
-            for ctx in store.contexts(triple):
-                if ctx in seen:
-                    continue
-                seen.add(ctx)
-                yield ctx
+        for x in iterable:
+            if x in seen:
+                continue
+            seen.add(x)
+            yield x
 
     def prefix(self, namespace):
         prefix = self.__bound_pref.get(namespace)
-        if prefix is None:
-            for store in self.__stores:
-                aprefix = store.prefix(namespace)
-                if aprefix and prefix and aprefix != prefix:
-                    msg = 'multiple prefixes ({},{}) for namespace {}'.format(prefix, aprefix, namespace)
-                    raise AggregatedStoresConflict(msg)
-                prefix = aprefix
+        if prefix is not None:
+            return prefix
+        # The aggregated stores' bindings can change without us knowing (e.g., by binding
+        # on a store directly), so we ask them each time
+        for store in self.__stores:
+            aprefix = store.prefix(namespace)
+            if aprefix and not self.__strict_prefix_check:
+                return aprefix
+            if aprefix and prefix and aprefix != prefix:
+                msg = 'multiple prefixes ({},{}) for namespace {}'.format(
+                        prefix, aprefix, namespace)
+                raise AggregatedStoresConflict(msg)
+            prefix = prefix or aprefix
         return prefix
 
     def namespace(self, prefix):
         namespace = self.__bound_ns.get(prefix)
-        if namespace is None:
-            for store in self.__stores:
-                anamespace = store.namespace(prefix)
-                if anamespace and namespace and anamespace != namespace:
-                    msg = 'multiple namespaces ({},{}) for prefix {}'.format(namespace, anamespace, prefix)
-                    raise AggregatedStoresConflict(msg)
-                namespace = anamespace
+        if namespace is not None:
+            return namespace
+        for store in self.__stores:
+            anamespace = store.namespace(prefix)
+            if anamespace and not self.__strict_prefix_check:
+                return anamespace
+            if anamespace and namespace and anamespace != namespace:
+                msg = 'multiple namespaces ({},{}) for prefix {}'.format(
+                        namespace, anamespace, prefix)
+                raise AggregatedStoresConflict(msg)
+            namespace = namespace or anamespace
         return namespace
 
     def namespaces(self):
-        for ns in self.__bound_ns.items():
-            yield ns
-        for store in self.__stores:
-            for ns in store.namespaces():
-                yield ns
+        # Stores commonly share bindings (e.g., for rdf and rdfs), so we drop duplicates
+        return iter(dict.fromkeys(chain(self.__bound_ns.items(),
+            (binding for store in self.__stores for binding in store.namespaces()))))
 
     def bind(self, prefix, namespace, override=True):
-        if not override and prefix in self.__bound_ns.get:
+        if not override and prefix in self.__bound_ns:
             return
         self.__bound_ns[prefix] = namespace
         self.__bound_pref[namespace] = prefix
 
     def close(self, *args, **kwargs):
+        self._invalidate()
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
         for store in self.__stores:
             store.close(*args, **kwargs)
 
@@ -126,21 +373,47 @@ class AggregateStore(Store):
             store.gc()
 
     def add(self, *args, **kwargs):
+        self._invalidate()
         return self.__stores[0].add(*args, **kwargs)
 
     def addN(self, *args, **kwargs):
+        self._invalidate()
         return self.__stores[0].addN(*args, **kwargs)
 
+    def bulk_add(self, triples, context, batch_size=1000):
+        '''
+        Adds triples to the first store in batches with `addN`
+
+        Prefer this to calling `add` for each triple when loading many triples.
+
+        Parameters
+        ----------
+        triples : iterable of tuple
+            The triples to add
+        context : rdflib.graph.Graph
+            The graph to add the triples to
+        batch_size : int, optional
+            The number of triples to pass to each `addN` call
+        '''
+        self._invalidate()
+        addN = self.__stores[0].addN
+        for group in grouper(triples, batch_size):
+            # The last group is padded with `None`, so we filter those out
+            addN((s, p, o, context) for s, p, o in filter(None, group))
+
     def remove(self, *args, **kwargs):
+        self._invalidate()
         self.__stores[0].remove(*args, **kwargs)
 
     def add_graph(self, *args, **kwargs):
+        self._invalidate()
         if not self.graph_aware:
             super().add_graph(*args, **kwargs)
         else:
             self.__stores[0].add_graph(*args, **kwargs)
 
     def remove_graph(self, *args, **kwargs):
+        self._invalidate()
         if not self.graph_aware:
             super().remove_graph(*args, **kwargs)
         else:
@@ -150,6 +423,7 @@ class AggregateStore(Store):
     def destroy(self, *args, **kwargs): raise UnsupportedAggregateOperation
 
     def rollback(self, *args, **kwargs):
+        self._invalidate()
         return self.__stores[0].rollback(*args, **kwargs)
 
     def commit(self, *args, **kwargs):
@@ -159,6 +433,70 @@ class AggregateStore(Store):
         return '%s(%s)' % (type(self).__name__, ', '.join(str(s) for s in self.__stores))
 
 
+def _has_predicate(store, predicate):
+    for _ in store.triples((None, predicate, None)):
+        return True
+    return False
+
+
+def _unique_triples(results):
+    seen = set()
+    for res in results:
+        triple = res[0]
+        if triple in seen:
+            continue
+        seen.add(triple)
+        yield res
+
+
+_PARALLEL_QUEUE_SIZE = 16
+'''
+Maximum number of batches waiting for the consumer in `AggregateStore._parallel_chain`
+'''
+
+_PARALLEL_BATCH_SIZE = 256
+'''
+Number of results a worker collects before passing them to the consumer in
+`AggregateStore._parallel_chain`
+'''
+
+_DONE = object()
+
+
+class _DrainFailure:
+    __slots__ = ('exception',)
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _drain_into(iterable_factory, results, stop):
+    def put(item):
+        # We time out on the put so we can notice when the consumer has stopped
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    try:
+        it = iter(iterable_factory())
+        while True:
+            batch = list(islice(it, _PARALLEL_BATCH_SIZE))
+            if not batch:
+                break
+            if not put(batch):
+                return
+    except BaseException as e:
+        # Even on, e.g., `SystemExit`, we have to tell the consumer, or it would wait for
+        # this worker forever
+        put(_DrainFailure(e))
+    else:
+        put(_DONE)
+
+
 class UnsupportedAggregateOperation(Exception):
     '''
     Thrown for operations which modify a graph and hence are inappropriate for
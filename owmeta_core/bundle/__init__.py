@@ -1,11 +1,14 @@
 from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from itertools import chain
-from os import makedirs, rename, scandir, listdir
+from os import cpu_count, makedirs, rename, scandir
 from os.path import (join as p, exists, relpath, isdir, isfile,
         expanduser, expandvars, realpath)
 from struct import pack
 import errno
 import hashlib
+import heapq
 import json
 import logging
 import re
@@ -27,8 +30,8 @@ from ..context_common import CONTEXT_IMPORTS
 from ..data import Data
 from ..file_match import match_files
 from ..file_lock import lock_file
-from ..file_utils import hash_file
-from ..graph_serialization import write_canonical_to_file
+from ..file_utils import hash_and_copy_file
+from ..graph_serialization import write_canonical
 from ..rdf_utils import BatchAddGraph
 from ..utils import FCN, aslist
 
@@ -43,6 +46,14 @@ from .loaders import LOADER_CLASSES, UPLOADER_CLASSES, load_entry_point_loaders
 
 from urllib.parse import quote as urlquote, unquote as urlunquote
 
+try:
+    from yaml import (CSafeLoader as _YAMLSafeLoader, CUnsafeLoader as _YAMLUnsafeLoader,
+                      CDumper as _YAMLDumper)
+except ImportError:
+    # PyYAML was built without libyaml
+    from yaml import (SafeLoader as _YAMLSafeLoader, UnsafeLoader as _YAMLUnsafeLoader,
+                      Dumper as _YAMLDumper)
+
 
 L = logging.getLogger(__name__)
 
@@ -57,6 +68,14 @@ Default directory for descriptors of user-level remotes as opposed to project-sp
 remotes
 '''
 
+INSTALL_MAX_WORKERS = min(8, cpu_count() or 1)
+'''
+Maximum number of threads used by `Installer` to hash and copy bundle files
+'''
+
+# Names a bundle manifest can have in an archive
+_ARCHIVE_MANIFEST_NAMES = (BUNDLE_MANIFEST_FILE_NAME, './' + BUNDLE_MANIFEST_FILE_NAME)
+
 
 class Remote(object):
     '''
@@ -141,7 +160,7 @@ class Remote(object):
         out : :term:`file object`
             Target for writing the remote
         '''
-        yaml.dump(self, out)
+        yaml.dump(self, out, Dumper=_YAMLDumper)
 
     @classmethod
     def read(cls, inp):
@@ -153,7 +172,7 @@ class Remote(object):
         inp : :term:`file object`
             File-like object containing the serialized `Remote`
         '''
-        res = yaml.unsafe_load(inp)
+        res = yaml.load(inp, Loader=_YAMLUnsafeLoader)
         assert isinstance(res, cls)
         return res
 
@@ -179,12 +198,9 @@ class Remote(object):
 
 
 class DependencyDescriptor(namedtuple('_DependencyDescriptor',
-        ('id', 'version', 'excludes'))):
+        ('id', 'version', 'excludes'), defaults=(None, ()))):
     __slots__ = ()
 
-    def __new__(cls, id, version=None, excludes=()):
-        return super(DependencyDescriptor, cls).__new__(cls, id, version, excludes)
-
 
 class AccessorConfig(object):
     '''
@@ -283,7 +299,7 @@ class Descriptor(object):
         .NotADescriptor
             Thrown when the object loaded from `descriptor_source` isn't a `dict`
         '''
-        dat = yaml.safe_load(descriptor_source)
+        dat = yaml.load(descriptor_source, Loader=_YAMLSafeLoader)
         if isinstance(dat, dict):
             return cls.make(dat)
         else:
@@ -311,32 +327,38 @@ class Descriptor(object):
         dct['dependencies'] = [dict(d._asdict()) for d in self.dependencies]
         if self.files is not None:
             dct['files'] = self.files.to_dict()
-        yaml.dump(dct, output)
+        yaml.dump(dct, output, Dumper=_YAMLDumper)
 
     def _set(self, obj):
         self.name = obj.get('name', self.id)
         self.version = obj.get('version', 1)
         self.description = obj.get('description', None)
-        self.patterns = set(make_pattern(x) for x in obj.get('patterns', ()))
-        self.includes = set(make_include_func(x) for x in obj.get('includes', ()))
-        self.empties = {uri for uri, options in (inc.popitem()
-            for inc in obj.get('includes', ())
-            if isinstance(inc, dict))
-            if options.get('empty', False) is True}
-
-        deps_set = set()
-        deps = _DepList()
+        self.patterns = {make_pattern(x) for x in obj.get('patterns', ())}
+
+        # Includes and empties come from the same entries, so we get both in one pass
+        includes = set()
+        empties = set()
+        for inc in obj.get('includes', ()):
+            includes.add(make_include_func(inc))
+            if isinstance(inc, dict):
+                # make_include_func has checked that there's just the one entry
+                for uri, options in inc.items():
+                    if options.get('empty', False) is True:
+                        empties.add(uri)
+        self.includes = includes
+        self.empties = empties
+
+        # A dict drops repeated dependencies while keeping them in the order given
+        deps = dict()
         for x in obj.get('dependencies', ()):
-            if isinstance(x, six.string_types):
+            if isinstance(x, str):
                 dd = DependencyDescriptor(x)
             elif isinstance(x, dict):
                 dd = DependencyDescriptor(**x)
             else:
                 dd = DependencyDescriptor(*x)
-            if dd not in deps_set:
-                deps.append(dd)
-                deps_set.add(dd)
-        self.dependencies = deps
+            deps.setdefault(dd, None)
+        self.dependencies = _DepList(deps)
         self.files = FilesDescriptor.make(obj.get('files', None))
 
     def __str__(self):
@@ -442,16 +464,25 @@ class Bundle:
 
         self._bundle_context = None
         self._loaded_dependencies = dict()
+        self._resolved = None
 
     @property
     def identifier(self):
         return self.ident
 
     def resolve(self):
+        # The bundle directory is remembered until the bundle is closed (see `__exit__`),
+        # so we don't have to scan the bundles directory every time we need the manifest
+        # or the contexts. It's keyed on the attributes that determine the directory in
+        # case they get changed
+        key = (self.bundles_directory, self.ident, self.version)
+        if self._resolved is not None and self._resolved[0] == key:
+            return self._resolved[1]
         try:
             bundle_directory = self._get_bundle_directory()
         except BundleNotFound:
             bundle_directory = self._fetch_bundle(self.ident, self.version)
+        self._resolved = (key, bundle_directory)
         return bundle_directory
 
     @property
@@ -489,7 +520,7 @@ class Bundle:
             indexed_db_path = p(bundle_directory, BUNDLE_INDEXED_DB_NAME)
             store_name, store_conf = self._store_config_builder.build(
                     indexed_db_path,
-                    manifest_data.get('dependencies', ()))
+                    manifest_data.get('dependencies') or ())
             self.conf['rdf.store'] = store_name
             self.conf['rdf.store_conf'] = store_conf
             self.connection = connect(conf=self.conf)
@@ -508,19 +539,16 @@ class Bundle:
         if self._contexts is not None:
             return self._contexts
         bundle_directory = self.resolve()
-        contexts = list()
         graphs_directory = p(bundle_directory, 'graphs')
         idx_fname = p(graphs_directory, 'index')
         if not exists(idx_fname):
             raise Exception('Cannot find an index at {}'.format(repr(idx_fname)))
+        # Read the index in one go rather than line-by-line: bundles can have a great many
+        # contexts
         with open(idx_fname, 'rb') as index_file:
-            for l in index_file:
-                l = l.strip()
-                if not l:
-                    continue
-                ctx, _ = l.split(b'\x00')
-                contexts.append(ctx.decode('UTF-8'))
-        self._contexts = frozenset(contexts)
+            lines = index_file.read().split(b'\n')
+        self._contexts = frozenset(l.split(b'\x00', 1)[0].decode('UTF-8')
+                for l in map(bytes.strip, lines) if l)
         return self._contexts
 
     @property
@@ -540,9 +568,10 @@ class Bundle:
         self.connection.disconnect()
         self.connection = None
         self.conf = None
+        self._resolved = None
 
     def dependencies(self):
-        return self.manifest_data.get('dependencies', ())
+        return self.manifest_data.get('dependencies') or ()
 
     def load_dependencies_transitive(self):
         '''
@@ -656,17 +685,28 @@ class BundleDependencyManager(object):
                     new_border[key] = d_bnd
             border = new_border
 
-        while dependants:
-            for key, this_dependants in dependants.items():
-                if not this_dependants:
-                    yield seen[key]
-                    break
-            else: # no break
-                break
+        # Kahn's algorithm. Among the bundles with no remaining dependants, we always take
+        # the one that was discovered first, so the order matches a breadth-first walk of
+        # the dependency graph
+        keys = list(dependants)
+        order = {key: idx for idx, key in enumerate(keys)}
+        dependencies = dict()
+        for key, this_dependants in dependants.items():
+            for dependant in this_dependants:
+                dependencies.setdefault(dependant, []).append(key)
+        ready = [order[key] for key, this_dependants in dependants.items()
+                 if not this_dependants]
+        heapq.heapify(ready)
+        while ready:
+            key = keys[heapq.heappop(ready)]
+            yield seen[key]
             del dependants[key]
 
-            for this_dependants in dependants.values():
+            for dependency in dependencies.get(key, ()):
+                this_dependants = dependants[dependency]
                 this_dependants.discard(key)
+                if not this_dependants:
+                    heapq.heappush(ready, order[dependency])
 
         if dependants:
             # Handle the case that we didn't deplete the adjacency list, implying that we
@@ -775,7 +815,7 @@ class BundleDependentStoreConfigBuilder(object):
 
     def _construct_store_config(self, indexed_db_path, dependencies,
                                 current_view_desc=None, view_descs=None, bundle_directory=None,
-                                read_only=True):
+                                read_only=True, dependency_manifests=None):
         '''
         Parameters
         ----------
@@ -796,13 +836,21 @@ class BundleDependentStoreConfigBuilder(object):
         read_only : boolean, optional
             Whether the *top-level* config, which may not be a bundle, is read-only (the
             bundle dependencies are always read-only)
+        dependency_manifests : dict, optional
+            Bundle directories and manifest data of dependencies already looked up while
+            building this config, keyed by bundle ID and version. The same dependency can
+            be reached through several views, so this saves re-scanning the bundles
+            directory and re-reading the manifest for each one
         '''
         if view_descs is None:
             view_descs = set()
         if current_view_desc is None:
             current_view_desc = _BDVD()
+        if dependency_manifests is None:
+            dependency_manifests = dict()
         dependency_configs = self._gather_dependency_configs(
-                dependencies, current_view_desc, view_descs, bundle_directory)
+                dependencies, current_view_desc, view_descs, bundle_directory,
+                dependency_manifests)
         fs_store_config = dict(url=indexed_db_path, read_only=read_only,
                 transaction_manager=self.transaction_manager)
         return [
@@ -810,7 +858,10 @@ class BundleDependentStoreConfigBuilder(object):
         ] + dependency_configs
 
     @aslist
-    def _gather_dependency_configs(self, dependencies, current_view_desc, view_descs, bundle_directory=None):
+    def _gather_dependency_configs(self, dependencies, current_view_desc, view_descs,
+            bundle_directory=None, dependency_manifests=None):
+        if dependency_manifests is None:
+            dependency_manifests = dict()
         for dd in dependencies:
             dep_view_desc = current_view_desc.merge_excludes(dd.get('excludes', ()))
             dep_ident = dd.get('id')
@@ -823,16 +874,21 @@ class BundleDependentStoreConfigBuilder(object):
             if (dep_view_desc, (dep_ident, dep_version)) in view_descs:
                 return
             view_descs.add((dep_view_desc, (dep_ident, dep_version)))
-            tries = 0
-            while tries < 2:
-                try:
-                    bundle_directory = find_bundle_directory(self.bundles_directory, dep_ident, dep_version)
-                    with open(p(bundle_directory, BUNDLE_MANIFEST_FILE_NAME)) as mf:
-                        manifest_data = json.load(mf)
-                    break
-                except (BundleNotFound, FileNotFoundError):
-                    self._fetch_bundle(dep_ident, dep_version)
-                    tries += 1
+            found = dependency_manifests.get((dep_ident, dep_version))
+            if found is None:
+                tries = 0
+                while tries < 2:
+                    try:
+                        bundle_directory = find_bundle_directory(self.bundles_directory, dep_ident, dep_version)
+                        with open(p(bundle_directory, BUNDLE_MANIFEST_FILE_NAME)) as mf:
+                            manifest_data = json.load(mf)
+                        break
+                    except (BundleNotFound, FileNotFoundError):
+                        self._fetch_bundle(dep_ident, dep_version)
+                        tries += 1
+                dependency_manifests[(dep_ident, dep_version)] = (bundle_directory, manifest_data)
+            else:
+                bundle_directory, manifest_data = found
 
             # We don't want to include items in the configuration that aren't specified by
             # the dependency descriptor. Also, all of the optionals have defaults that
@@ -842,8 +898,9 @@ class BundleDependentStoreConfigBuilder(object):
             yield ('owmeta_core_bds', dict(type='agg',
                         conf=self._construct_store_config(
                             p(bundle_directory, BUNDLE_INDEXED_DB_NAME),
-                            manifest_data.get('dependencies', ()),
-                            dep_view_desc, view_descs, bundle_directory),
+                            manifest_data.get('dependencies') or (),
+                            dep_view_desc, view_descs, bundle_directory,
+                            dependency_manifests=dependency_manifests),
                         **addl_dep_confs))
 
     def _fetch_bundle(self, bundle_ident, version):
@@ -1002,6 +1059,12 @@ class Fetcher(_RemoteHandlerMixin):
         self._transaction_manager = (transaction_manager or
                 transaction.TransactionManager())
 
+        # Loaders generated for each remote, keyed by name of the remote. Loaders may cache
+        # what they learn about a remote (e.g., the bundle index for an HTTP remote), so
+        # reusing them avoids asking the remote again when fetching dependencies or
+        # several bundles with the same `Fetcher`
+        self._loaders = dict()
+
     def __call__(self, *args, **kwargs):
         '''
         Calls `fetch` with the given arguments
@@ -1062,7 +1125,7 @@ class Fetcher(_RemoteHandlerMixin):
                 loader(bundle_id, bundle_version)
                 with open(p(bdir, BUNDLE_MANIFEST_FILE_NAME)) as mf:
                     manifest_data = json.load(mf)
-                    for dd in manifest_data.get('dependencies', ()):
+                    for dd in manifest_data.get('dependencies') or ():
                         try:
                             find_bundle_directory(self.bundles_root, dd['id'], dd.get('version'))
                         except BundleNotFound:
@@ -1131,14 +1194,30 @@ class Fetcher(_RemoteHandlerMixin):
                     'Could not get any remotes to generate loaders from') from e
         else:
             for rem in retrieved_remotes:
-                for loader in rem.generate_loaders():
+                for loader in self._remote_loaders(rem):
                     if loader.can_load(bundle_id, bundle_version):
                         yield loader
 
+    def _remote_loaders(self, remote):
+        # Remotes may be re-read for each fetch, so we can't go by the identity of the
+        # `Remote` object. Instead, loaders are reused for a remote with the same name as
+        # long as it has the same accessor configs
+        configs = list(remote.accessor_configs)
+        entry = self._loaders.get(remote.name)
+        if entry is None or not _same_accessor_configs(entry[0], configs):
+            entry = (configs, list(remote.generate_loaders()))
+            self._loaders[remote.name] = entry
+        return entry[1]
+
     def __str__(self):
         return f'{self.__class__.__name__}(bundles_root={self.bundles_root}, remotes={self.remotes})'
 
 
+def _same_accessor_configs(configs, other_configs):
+    return (len(configs) == len(other_configs) and
+            all(type(a) is type(b) and a == b for a, b in zip(configs, other_configs)))
+
+
 class Deployer(_RemoteHandlerMixin):
     '''
     Deploys bundles to `Remotes <Remote>`.
@@ -1217,15 +1296,19 @@ class Deployer(_RemoteHandlerMixin):
 
     def _get_archive_manifest_data(self, bundle_path):
         with Unarchiver().to_tarfile(bundle_path) as tf:
+            # Look for the manifest in archive order rather than with `extractfile(name)`,
+            # which reads every member header (decompressing the whole archive) first
+            for member in tf:
+                if member.name in _ARCHIVE_MANIFEST_NAMES:
+                    break
+            else: # no break
+                raise MalformedBundle(bundle_path, 'no bundle manifest found')
+            mf0 = tf.extractfile(member)
+            if mf0 is None:
+                raise MalformedBundle(bundle_path, 'manifest is not a regular file')
             try:
-                mf0 = tf.extractfile(BUNDLE_MANIFEST_FILE_NAME)
-                if mf0 is None:
-                    raise MalformedBundle(bundle_path, 'manifest is not a regular file')
-                # Would like to pull the
                 with mf0 as mf:
                     return json.load(mf)
-            except KeyError:
-                raise MalformedBundle(bundle_path, 'no bundle manifest found')
             except json.decoder.JSONDecodeError:
                 raise MalformedBundle(bundle_path, 'manifest is malformed: expected a'
                         ' JSON file')
@@ -1256,46 +1339,57 @@ class Cache(object):
                 return
             raise
 
-        for bundle_directory in bundle_directories:
-            if not bundle_directory.is_dir():
-                continue
-
-            # Ignore deletes out from under us
-            try:
-                version_directories = scandir(bundle_directory.path)
-            except (OSError, IOError) as e:
-                if e.errno == errno.ENOENT:
+        with bundle_directories:
+            for bundle_directory in bundle_directories:
+                if not bundle_directory.is_dir():
                     continue
-                raise
 
-            def keyfunc(x):
+                # Ignore deletes out from under us
                 try:
-                    return int(x.name)
-                except ValueError:
-                    return float('+inf')
+                    version_directories = scandir(bundle_directory.path)
+                except (OSError, IOError) as e:
+                    if e.errno == errno.ENOENT:
+                        continue
+                    raise
 
-            for version_directory in sorted(version_directories, key=keyfunc, reverse=True):
-                if not version_directory.is_dir():
-                    continue
-                try:
+                with version_directories:
+                    version_directories = sorted(version_directories,
+                            key=_version_directory_sort_key)
+
+                bd_id = urlunquote(bundle_directory.name)
+                for version_directory in version_directories:
+                    # Only version directories can have a manifest that matches
+                    if (not version_directory.name.isdecimal() or
+                            not version_directory.is_dir()):
+                        continue
                     manifest_fname = p(version_directory.path, BUNDLE_MANIFEST_FILE_NAME)
-                    with open(manifest_fname) as mf:
-                        try:
-                            manifest_data = json.load(mf)
-                            bd_id = urlunquote(bundle_directory.name)
-                            bd_version = int(version_directory.name)
-                            if (bd_id != manifest_data.get('id') or
-                                    bd_version != manifest_data.get('version')):
-                                L.warning('Bundle manifest at %s does not match bundle'
-                                ' directory', manifest_fname)
-                                continue
-                            yield manifest_data
-                        except json.decoder.JSONDecodeError:
-                            L.warning("Bundle manifest at %s is malformed",
-                                   manifest_fname)
-                except (OSError, IOError) as e:
-                    if e.errno != errno.ENOENT:
-                        raise
+                    try:
+                        with open(manifest_fname, 'rb') as mf:
+                            manifest_bytes = mf.read()
+                    except (OSError, IOError) as e:
+                        if e.errno != errno.ENOENT:
+                            raise
+                        continue
+                    try:
+                        manifest_data = json.loads(manifest_bytes)
+                    except json.decoder.JSONDecodeError:
+                        L.warning("Bundle manifest at %s is malformed", manifest_fname)
+                        continue
+                    if (bd_id != manifest_data.get('id') or
+                            int(version_directory.name) != manifest_data.get('version')):
+                        L.warning('Bundle manifest at %s does not match bundle directory',
+                                manifest_fname)
+                        continue
+                    yield manifest_data
+
+
+def _version_directory_sort_key(version_directory):
+    # Sorts newest versions first. Checking `isdecimal` rather than catching the
+    # `ValueError` from `int` is cheaper for the non-version entries
+    name = version_directory.name
+    if name.isdecimal():
+        return -int(name)
+    return float('-inf')
 
 
 def retrieve_remote_by_name(remotes_dir, name, **kwargs):
@@ -1322,16 +1416,17 @@ def retrieve_remotes(remotes_dir, load_entry_points=True):
     if load_entry_points:
         load_entry_point_loaders()
 
-    for r in listdir(remotes_dir):
-        if r.endswith('.remote'):
-            fname = p(remotes_dir, r)
-            with open(fname) as inp:
-                try:
-                    rem = Remote.read(inp)
-                    rem.file_name = fname
-                    yield rem
-                except Exception:
-                    L.warning('Unable to read remote %s', r, exc_info=True)
+    with scandir(remotes_dir) as ents:
+        for ent in ents:
+            if ent.name.endswith('.remote') and ent.is_file():
+                fname = ent.path
+                with open(fname) as inp:
+                    try:
+                        rem = Remote.read(inp)
+                        rem.file_name = fname
+                        yield rem
+                    except Exception:
+                        L.warning('Unable to read remote %s', ent.name, exc_info=True)
 
 
 class Installer(object):
@@ -1461,13 +1556,26 @@ class Installer(object):
         return graphs_directory, files_directory
 
     def _write_file_hashes(self, descriptor, files_directory):
+        def hash_and_copy(fname):
+            hsh = self.file_hash()
+            hash_and_copy_file(hsh,
+                    p(self.source_directory, fname),
+                    p(files_directory, fname))
+            return hsh
+
+        fnames = list(_select_files(descriptor, self.source_directory))
+        if len(fnames) > 1:
+            with ThreadPoolExecutor(
+                    max_workers=min(INSTALL_MAX_WORKERS, len(fnames))) as executor:
+                hashes = list(executor.map(hash_and_copy, fnames))
+        else:
+            hashes = [hash_and_copy(fname) for fname in fnames]
+
+        # Written in the order the files were selected so the hashes file is the same
+        # no matter which copy finishes first
         with open(p(files_directory, 'hashes'), 'wb') as hash_out:
-            for fname in _select_files(descriptor, self.source_directory):
-                hsh = self.file_hash()
-                source_fname = p(self.source_directory, fname)
-                hash_file(hsh, source_fname)
+            for fname, hsh in zip(fnames, hashes):
                 self._write_hash_line(hash_out, fname.encode('UTF-8'), hsh)
-                shutil.copy2(source_fname, p(files_directory, fname))
 
     def _write_context_data(self, descriptor, graphs_directory):
         contexts = _select_contexts(descriptor, self.graph)
@@ -1534,8 +1642,11 @@ class Installer(object):
                 'excludes': dd.excludes})
         manifest_data['dependencies'] = mf_deps
         self.manifest_data = manifest_data
-        with open(p(staging_directory, BUNDLE_MANIFEST_FILE_NAME), 'w') as mf:
-            json.dump(manifest_data, mf, separators=(',', ':'))
+        # Encoded in one go rather than having `json.dump` push each piece through a text
+        # file's encoder
+        manifest_bytes = json.dumps(manifest_data, separators=(',', ':')).encode('UTF-8')
+        with open(p(staging_directory, BUNDLE_MANIFEST_FILE_NAME), 'wb') as mf:
+            mf.write(manifest_bytes)
 
     def _generate_bundle_imports_ctx(self, descriptor, graphs_directory):
         if not self.imports_ctx:
@@ -1598,15 +1709,17 @@ class Installer(object):
     def _write_graph_to_file(self, ctxgraph, graphs_directory):
         hsh = self.context_hash()
         temp_fname = p(graphs_directory, 'graph.tmp')
-        write_canonical_to_file(ctxgraph, temp_fname)
-        hash_file(hsh, temp_fname)
+        with open(temp_fname, 'wb') as f:
+            write_canonical(ctxgraph, _HashingWriter(f, hsh))
         gbname = hsh.hexdigest() + '.nt'
         ctx_file_name = p(graphs_directory, gbname)
         rename(temp_fname, ctx_file_name)
         return gbname, hsh
 
     def _write_hash_line(self, hash_out, key, hsh):
-        hash_out.write(key + b'\x00' + pack('B', hsh.digest_size) + hsh.digest() + b'\n')
+        # `hash_out` is buffered, so we just avoid building intermediate `bytes` for the line
+        hash_out.write(b''.join((key, b'\x00', pack('B', hsh.digest_size), hsh.digest(),
+                                 b'\n')))
 
     def _write_index_line(self, index_out, ctxidb, gbname):
         index_out.write(ctxidb + b'\x00' + gbname.encode('UTF-8') + b'\n')
@@ -1642,14 +1755,16 @@ class Installer(object):
     def _cover_with_dependencies(self, uncovered_contexts, descriptor):
         # XXX: Will also need to check for the contexts having a given ID being consistent
         # with each other across dependencies
-        dependencies = descriptor.dependencies
-        for d in dependencies:
+        # Bundle.contexts holds plain strings, so key the uncovered contexts by string to
+        # take them out with set operations
+        remaining = {str(c): c for c in uncovered_contexts}
+        for d in descriptor.dependencies:
+            if not remaining:
+                break
             bnd = self._dd_to_bundle(d)
-            for c in bnd.contexts:
-                uncovered_contexts.discard(URIRef(c))
-                if not uncovered_contexts:
-                    break
-        return uncovered_contexts
+            for c in remaining.keys() & bnd.contexts:
+                del remaining[c]
+        return set(remaining.values())
 
 
 def fmt_bundle_imports_ctx_id(id, version):
@@ -1696,7 +1811,10 @@ class FilesDescriptor(object):
         return res
 
 
+@lru_cache(maxsize=4096)
 def make_pattern(s):
+    # Patterns are cached since the same ones tend to be repeated across descriptors and
+    # compiling them is the expensive part
     if s.startswith('rgx:'):
         return RegexURIPattern(s[4:])
     else:
@@ -1705,7 +1823,7 @@ def make_pattern(s):
 
 def make_include_func(s):
     if isinstance(s, str):
-        return URIIncludeFunc(s)
+        return _include_func(s)
     elif isinstance(s, dict):
         uri = None
         for k in s.keys():
@@ -1714,21 +1832,27 @@ def make_include_func(s):
                         f' the context to include. Extra key is "{k}"')
             uri = k
 
-        return URIIncludeFunc(uri)
+        return _include_func(uri)
     else:
         raise ValueError('Context "includes" entry must be a str or a dict')
 
 
+@lru_cache(maxsize=4096)
+def _include_func(uri):
+    return URIIncludeFunc(uri)
+
+
 class URIIncludeFunc(object):
 
     def __init__(self, include):
         self.include = URIRef(include.strip())
+        self._key = str(self.include)
 
     def __hash__(self):
         return hash(self.include)
 
     def __call__(self, uri):
-        return URIRef(uri.strip()) == self.include
+        return str(uri).strip() == self._key
 
     def __str__(self):
         return '{}({})'.format(FCN(type(self)), repr(self.include))
@@ -1772,6 +1896,19 @@ class GlobURIPattern(RegexURIPattern):
         super(GlobURIPattern, self).__init__(re.compile(pattern))
 
 
+class _HashingWriter(object):
+    '''
+    Wraps a binary file, updating a hash object with everything written to it
+    '''
+    def __init__(self, f, hsh):
+        self.f = f
+        self.hsh = hsh
+
+    def write(self, b):
+        self.hsh.update(b)
+        return self.f.write(b)
+
+
 def _select_files(descriptor, directory):
     fdescr = descriptor.files
     if not fdescr:
@@ -1787,17 +1924,52 @@ def _select_files(descriptor, directory):
 
 
 def _select_contexts(descriptor, graph):
+    include_uris = set()
+    include_funcs = []
+    for inc in descriptor.includes:
+        if isinstance(inc, URIIncludeFunc):
+            include_uris.add(inc._key)
+        else:
+            include_funcs.append(inc)
+
+    regexes = []
+    pattern_funcs = []
+    for pat in descriptor.patterns:
+        if _combinable_pattern(pat):
+            regexes.append(pat._pattern.pattern)
+        else:
+            pattern_funcs.append(pat)
+
+    if regexes:
+        combined_match = re.compile('|'.join(f'(?:{r})' for r in regexes)).match
+    else:
+        combined_match = None
+
     for context in graph.contexts():
         ctx = context.identifier
-        for inc in descriptor.includes:
-            if inc(ctx):
-                yield ctx, context
-                break
+        ctxstr = str(ctx)
+        if (ctxstr.strip() in include_uris or
+                any(inc(ctx) for inc in include_funcs) or
+                (combined_match is not None and combined_match(ctxstr)) or
+                any(pat(ctx) for pat in pattern_funcs)):
+            yield ctx, context
 
-        for pat in descriptor.patterns:
-            if pat(ctx):
-                yield ctx, context
-                break
+
+_DEFAULT_REGEX_FLAGS = re.compile('').flags
+
+
+def _combinable_pattern(pat):
+    '''
+    Whether the pattern can be matched as part of a single alternation with other
+    patterns: it has to be a plain regex without groups (which would be renumbered) or
+    flags (which would be lost)
+    '''
+    if not isinstance(pat, RegexURIPattern):
+        return False
+    rgx = pat._pattern
+    return (isinstance(rgx.pattern, str) and
+            not rgx.groups and
+            rgx.flags == _DEFAULT_REGEX_FLAGS)
 
 
 def build_indexed_database(dest, bundle_directory, transaction_manager,
@@ -1811,26 +1983,23 @@ def build_indexed_database(dest, bundle_directory, transaction_manager,
     # separate
     triples_read = 0
     with open(idx_fname) as index_file:
-        cnt = 0
-        for l in index_file:
-            cnt += 1
-        index_file.seek(0)
         if progress is not None:
-            progress.total = cnt
+            progress.total = sum(1 for _ in index_file)
+            index_file.seek(0)
         with transaction_manager:
-            bag = BatchAddGraph(dest, batchsize=10000)
-            for l in index_file:
-                ctx, fname = l.strip().split('\x00')
-                parser = plugin.get('nt', Parser)()
-                graph_fname = p(bundle_directory, 'graphs', fname)
-                with open(graph_fname, 'rb') as f, bag.get_context(ctx) as g:
-                    parser.parse(create_input_source(f), g)
-
-                if progress is not None:
-                    progress.update(1)
-                if trip_prog is not None:
-                    trip_prog.update(bag.count - triples_read)
-                triples_read = g.count
+            with BatchAddGraph(dest, batchsize=10000) as bag:
+                for l in index_file:
+                    ctx, fname = l.strip().split('\x00')
+                    parser = plugin.get('nt', Parser)()
+                    graph_fname = p(bundle_directory, 'graphs', fname)
+                    with open(graph_fname, 'rb') as f, bag.get_context(ctx) as g:
+                        parser.parse(create_input_source(f), g)
+
+                    if progress is not None:
+                        progress.update(1)
+                    if trip_prog is not None:
+                        trip_prog.update(bag.count - triples_read)
+                    triples_read = g.count
             if progress is not None:
                 progress.write('Finalizing writes to database...')
     if progress is not None:
@@ -1,9 +1,11 @@
 from contextlib import contextmanager
 import logging
-from os import scandir, walk
-from os.path import join as p, relpath, realpath, abspath, isdir, dirname
+from os import scandir, sep, walk
+from os.path import join as p, realpath, abspath, isdir, dirname, normpath
 import json
+import lzma
 import shutil
+from subprocess import Popen, PIPE, CalledProcessError
 import tarfile
 import tempfile
 
@@ -14,6 +16,21 @@ from .exceptions import NotABundlePath
 
 L = logging.getLogger(__name__)
 
+ARCHIVE_COPY_BUFSIZE = 2 * 1024 * 1024
+'''
+Size of the buffer used by `Archiver` when copying files into an archive and by
+`Unarchiver` when extracting files from one
+'''
+
+ARCHIVE_XZ_COMMAND = None
+'''
+Command, without output options, used by `Archiver.pack` to compress archives, like
+``('xz', '-T0')``. An external, multi-threaded ``xz`` can be much faster than compressing
+in this process for large bundles, but its output depends on the version of ``xz``
+installed, so by default (`None`), archives are compressed with `lzma`. If the executable
+can't be found, `lzma` is used as well.
+'''
+
 
 class Unarchiver(object):
     '''
@@ -144,15 +161,18 @@ class Unarchiver(object):
     @classmethod
     @contextmanager
     def _manifest(cls, ba, input_file):
-        try:
-            ef = ba.extractfile('./manifest')
-        except KeyError:
-            try:
-                # Both ./manifest and manifest are valid...just have to try both of them
-                ef = ba.extractfile('manifest')
-            except KeyError:
-                file_name = cls._bundle_file_name(input_file)
-                raise NotABundlePath(file_name, 'archive has no manifest')
+        # Look through the members in archive order rather than by name: looking up a
+        # member by name reads every member header first, which, for a compressed
+        # archive, means decompressing the whole thing before we even get to extract it.
+        # The manifest is at the top of the bundle directory, so it comes early.
+        for member in ba:
+            # Both ./manifest and manifest are valid
+            if member.name in ('./manifest', 'manifest'):
+                ef = ba.extractfile(member)
+                break
+        else:
+            file_name = cls._bundle_file_name(input_file)
+            raise NotABundlePath(file_name, 'archive has no manifest')
 
         with ef as manifest:
             file_name = cls._bundle_file_name(input_file)
@@ -189,6 +209,8 @@ class Unarchiver(object):
     @contextmanager
     def _to_tarfile0(cls, f):
         with tarfile.open(mode='r:xz', fileobj=f) as ba:
+            # Same as for `Archiver`: copy out the (possibly large) files in bigger blocks
+            ba.copybufsize = ARCHIVE_COPY_BUFSIZE
             yield ba
 
 
@@ -207,6 +229,10 @@ class ArchiveExtractor(object):
         '''
         self._targetdir = targetdir
         self._tarfile = tarfile
+        self._resolved_targetdir = self._realpath(targetdir)
+        # Until a link is extracted into an empty target directory, nothing under it can
+        # redirect a path, so paths only need normalizing rather than resolving
+        self._normalize_only = _empty_or_missing_directory(targetdir)
 
     def extract(self):
         '''
@@ -220,8 +246,10 @@ class ArchiveExtractor(object):
     def _badpath(self, path, base=None):
         # joinpath will ignore base if path is absolute
         if base is None:
-            base = self._targetdir
-        return not self._realpath(p(self._targetdir, path)).startswith(base)
+            base = self._resolved_targetdir
+            if self._normalize_only:
+                return not _path_within(normpath(p(base, path)), base)
+        return not _path_within(self._realpath(p(self._targetdir, path)), base)
 
     def _badlink(self, info):
         # Links are interpreted relative to the directory containing the link
@@ -230,7 +258,9 @@ class ArchiveExtractor(object):
         return self._badpath(info.linkname, base=tip)
 
     def _safemembers(self):
-        for finfo in self._tarfile.members:
+        # Iterating the tarfile, rather than its members list, reads member headers as
+        # they are extracted
+        for finfo in self._tarfile:
             if self._badpath(finfo.name):
                 raise _BadArchiveFilePath(finfo.name, 'Path is outside of base path "%s"' % self._targetdir)
             elif finfo.issym() and self._badlink(finfo):
@@ -241,13 +271,29 @@ class ArchiveExtractor(object):
                         'Symlink points to "%s", outside of "%s"' % (finfo.linkname,
                             self._targetdir))
             else:
+                if finfo.issym() or finfo.islnk():
+                    self._normalize_only = False
                 yield finfo
 
     def validate(self):
-        for _ in self._tarfile._safemembers():
+        for _ in self._safemembers():
             pass
 
 
+def _empty_or_missing_directory(path):
+    try:
+        with scandir(path) as entries:
+            for _ in entries:
+                return False
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def _path_within(path, base):
+    return path == base or path.startswith(base.rstrip(sep) + sep)
+
+
 class _BadArchiveFilePath(Exception):
     '''
     Thrown when an archive file path points outside of a given base directory
@@ -327,23 +373,55 @@ class Archiver(object):
                         ' has not been provided')
             bnd_directory = find_bundle_directory(self.bundles_directory, bundle_id, version)
 
-        accept = self._filter
         try:
-            _tf = tarfile.open(target_path, mode='w:xz')
+            _fp = open(target_path, 'wb')
         except FileNotFoundError as e:
             if e.filename == target_path:
                 raise ArchiveTargetPathDoesNotExist(target_path) from e
             raise
         else:
-            with _tf as tf:
-                for dirpath, dirs, files in walk(bnd_directory):
-                    for f in files:
-                        fpath = p(dirpath, f)
-                        rpath = relpath(fpath, start=bnd_directory)
-                        if accept(rpath, fpath):
-                            tf.add(fpath, rpath)
+            with _fp as fp, _xz_compressor(fp) as xzf,\
+                    tarfile.open(fileobj=xzf, mode='w|') as tf:
+                self._add_files(tf, bnd_directory)
         return target_path
 
+    def write(self, output_file, bundle_directory):
+        '''
+        Write an archive of a bundle directory to a file object
+
+        The archive is written sequentially, so `output_file` need not be seekable (e.g.,
+        it can be a pipe)
+
+        Parameters
+        ----------
+        output_file : :term:`file object`
+            The binary file to write the archive to
+        bundle_directory : str
+            Bundle directory
+        '''
+        with tarfile.open(fileobj=output_file, mode='w|xz') as tf:
+            self._add_files(tf, bundle_directory)
+
+    def _add_files(self, tf, bnd_directory):
+        # Bundles can have large files (e.g., serialized graphs), so we copy them into the
+        # archive in larger blocks than the default. Older versions of `tarfile` ignore
+        # this attribute
+        tf.copybufsize = ARCHIVE_COPY_BUFSIZE
+        accept = self._filter
+        # Every path from `walk` starts with the bundle directory, so we can slice off the
+        # prefix instead of calling `relpath` for each one
+        prefix_len = len(p(bnd_directory, ''))
+        for dirpath, dirs, files in walk(bnd_directory):
+            # Like `BundleTreeFileIgnorer`, treat a directory that doesn't pass the filter
+            # as excluding everything under it, so we don't walk it at all
+            dirs[:] = [d for d in dirs
+                       if accept(p(dirpath, d)[prefix_len:], p(dirpath, d))]
+            for f in files:
+                fpath = p(dirpath, f)
+                rpath = fpath[prefix_len:]
+                if accept(rpath, fpath):
+                    tf.add(fpath, rpath)
+
     def _filter(self, path, fullpath):
         '''
         Filters out file names that are not to be included in a bundle
@@ -351,6 +429,48 @@ class Archiver(object):
         return bundle_tree_filter(path, fullpath)
 
 
+@contextmanager
+def _xz_compressor(output_file):
+    '''
+    Provides a file object that xz-compresses everything written to it into
+    `output_file`, using `ARCHIVE_XZ_COMMAND` if it is available and `lzma` otherwise
+    '''
+    command = ARCHIVE_XZ_COMMAND
+    xz_executable = command and shutil.which(command[0])
+    if not xz_executable:
+        if command:
+            L.warning('Compressing with lzma since %s was not found', command[0])
+        with lzma.open(output_file, 'wb') as xzf:
+            yield xzf
+        return
+
+    broken_pipe = None
+    proc = Popen([xz_executable, *command[1:], '-c'], stdin=PIPE, stdout=output_file)
+    try:
+        try:
+            yield proc.stdin
+            # Flushes what's left in the buffer
+            proc.stdin.close()
+        except BrokenPipeError as e:
+            # The process exited before reading everything. Its exit status says why
+            broken_pipe = e
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            # Flushing fails if the process is gone, but then there's already an error
+            # to report
+            pass
+        proc.wait()
+    if proc.returncode != 0:
+        raise CalledProcessError(proc.returncode, proc.args) from broken_pipe
+    if broken_pipe is not None:
+        raise broken_pipe
+
+
 @contextmanager
 def ensure_archive(bundle_path):
     '''
@@ -363,16 +483,10 @@ def ensure_archive(bundle_path):
     '''
     if isdir(bundle_path):
         with tempfile.TemporaryDirectory() as tempdir:
-            archive_path = Archiver(tempdir).pack(
+            # No need to check that this is a TAR file: Archiver raises an exception if it
+            # can't make one
+            yield Archiver(tempdir).pack(
                     bundle_directory=bundle_path, target_file_name='bundle.tar.xz')
-            if not tarfile.is_tarfile(archive_path):
-                # We don't really care about the TAR file being properly formatted here --
-                # it's up to the server to tell us it can't process the bundle. We just
-                # check if it's a TAR file for the convenience of the user.
-                L.error('Archiver did not create a valid tar file, but did not raise an'
-                        'error: this should not happen.')
-                raise NotABundlePath(bundle_path, 'Expected a directory or a tar file')
-            yield archive_path
     elif tarfile.is_tarfile(bundle_path):
         # We don't really care about the TAR file being properly formatted here --
         # it's up to the server to tell us it can't process the bundle. We just
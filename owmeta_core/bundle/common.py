@@ -1,3 +1,4 @@
+from functools import lru_cache
 from os import scandir
 from os.path import join as p, exists, relpath
 import errno
@@ -46,13 +47,20 @@ def fmt_bundle_directory(bundles_directory, ident, version=None):
         Version number. If not provided, returns the directory containing all of the
         versions
     '''
-    base = p(bundles_directory, urlquote(ident, safe=''))
+    base = p(bundles_directory, _quote_ident(ident))
     if version is not None:
         return p(base, str(version))
     else:
         return base
 
 
+@lru_cache(maxsize=4096)
+def _quote_ident(ident):
+    # Bundle directories are formatted repeatedly for the same few bundle IDs when
+    # resolving dependencies
+    return urlquote(ident, safe='')
+
+
 def validate_manifest(bundle_path, manifest_data):
     '''
     Validate manifest data in a `dict`
@@ -111,28 +119,24 @@ def find_bundle_directory(bundles_directory, ident, version=None):
                 raise BundleNotFound(ident, 'Bundle directory does not exist') from e
             raise
 
-        for ent in ents:
-            if ent.is_dir():
-                try:
+        with ents:
+            for ent in ents:
+                # We may put things other than versioned bundle directories in this
+                # directory later, so anything not named like a version is skipped
+                if ent.name.isdecimal() and ent.is_dir():
                     vn = int(ent.name)
-                except ValueError:
-                    # We may put things other than versioned bundle directories in
-                    # this directory later, in which case this is OK
-                    pass
-                else:
                     if vn > latest_version:
                         latest_version = vn
-        version = latest_version
+        if not latest_version:
+            raise BundleNotFound(ident, 'No versioned bundle directories exist')
+        # No need to check that it exists: we just saw it
+        return fmt_bundle_directory(bundles_directory, ident, latest_version)
     if not version:
         raise BundleNotFound(ident, 'No versioned bundle directories exist')
     res = fmt_bundle_directory(bundles_directory, ident, version)
     if not exists(res):
-        if version is None:
-            raise BundleNotFound(ident,
-                    f'Bundle directory, "{res}", does not exist')
-        else:
-            raise BundleNotFound(ident,
-                    f'Bundle directory, "{res}", does not exist for the specified version', version)
+        raise BundleNotFound(ident,
+                f'Bundle directory, "{res}", does not exist for the specified version', version)
     return res
 
 
@@ -1,13 +1,14 @@
 import http.client
-import io
 import logging
 import os
-from os.path import join as p, expanduser
+from os.path import join as p, expanduser, isdir
 import ssl
 from urllib.parse import quote as urlquote, urlparse
 import hashlib
 import json
 import pickle
+import tarfile
+import tempfile
 
 from cachecontrol import CacheControl
 from cachecontrol.caches.file_cache import FileCache
@@ -19,14 +20,34 @@ from ...command_util import GenericUserError
 from ...utils import FCN, retrieve_provider
 
 from .. import URLConfig
-from ..archive import ensure_archive, Unarchiver
+from ..archive import Archiver, Unarchiver
 from ..common import BUNDLE_ARCHIVE_MIME_TYPE
+from ..exceptions import NotABundlePath
 
 from . import LoadFailed, Loader, Uploader
 
 
 L = logging.getLogger(__name__)
 
+ARCHIVE_SPOOL_SIZE = 64 * 1024 * 1024
+'''
+Size in bytes above which an archive created by `HTTPBundleUploader` for a bundle directory,
+or downloaded by `HTTPBundleLoader` without a cache directory, is written to a temporary
+file rather than kept in memory
+'''
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+'''
+Size in bytes of the blocks `HTTPBundleUploader` reads from an archive and sends to the
+server
+'''
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+'''
+Size in bytes of the chunks `HTTPBundleLoader` reads from the response when downloading a
+bundle archive
+'''
+
 
 class HTTPURLConfig(URLConfig):
     '''
@@ -231,6 +252,29 @@ class HTTPSURLError(Exception):
     pass
 
 
+def _read_cached_index(cache_fname):
+    '''
+    Read an index cached by `HTTPBundleLoader`. Returns `None` if there isn't one or if it
+    isn't in the expected form
+    '''
+    try:
+        with open(cache_fname) as cache_file:
+            cached = json.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        L.warning('Ignoring malformed cached index at %s', cache_fname)
+        return None
+
+    if (not isinstance(cached, dict) or
+            not isinstance(cached.get('index'), dict) or
+            not isinstance(cached.get('etag') or '', str) or
+            not isinstance(cached.get('last_modified') or '', str)):
+        L.warning('Ignoring malformed cached index at %s', cache_fname)
+        return None
+    return cached
+
+
 class HTTPBundleLoader(Loader):
     '''
     Loads bundles from HTTP(S) resources listed in an index file
@@ -279,12 +323,17 @@ class HTTPBundleLoader(Loader):
         self.cachedir = cachedir
         self._session = getattr(index_url, 'session', None) or requests.Session()
         self._index = None
+        # Versions listed in the index by bundle ID. See `_bundle_version_keys`
+        self._version_keys = dict()
 
     def __repr__(self):
         return '{}({})'.format(FCN(type(self)), repr(self.index_url))
 
     def _setup_index(self):
         if self._index is None:
+            if self.cachedir is not None:
+                self._index = self._load_cached_index()
+                return
             response = self._session.get(self.index_url)
             if response.status_code != 200:
                 raise IndexLoadFailed(response)
@@ -293,6 +342,50 @@ class HTTPBundleLoader(Loader):
             except json.decoder.JSONDecodeError:
                 raise IndexLoadFailed(response)
 
+    def _load_cached_index(self):
+        '''
+        Get the index, revalidating our copy in `cachedir` with the server if we have one
+        '''
+        # The '@' keeps the name from colliding with a (URL-quoted) bundle archive name
+        cache_fname = p(self.cachedir, 'index@' +
+                hashlib.sha224(self.index_url.encode('UTF-8')).hexdigest())
+        headers = {}
+        cached = _read_cached_index(cache_fname)
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self._session.get(self.index_url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            return cached['index']
+        if response.status_code != 200:
+            raise IndexLoadFailed(response)
+        try:
+            index = response.json()
+        except json.decoder.JSONDecodeError:
+            raise IndexLoadFailed(response)
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        # Without either of these, we couldn't revalidate the cached copy, so we'd just
+        # have to get the index again next time anyway
+        if etag or last_modified:
+            # Written to a temporary file and moved into place so that another loader
+            # never reads a partially written cache file
+            with tempfile.NamedTemporaryFile('w', dir=self.cachedir, prefix='index@',
+                    suffix='.tmp', delete=False) as cache_file:
+                try:
+                    json.dump(dict(etag=etag, last_modified=last_modified, index=index),
+                            cache_file)
+                except BaseException:
+                    cache_file.close()
+                    os.unlink(cache_file.name)
+                    raise
+            os.replace(cache_file.name, cache_fname)
+        return index
+
     @classmethod
     def can_load_from(cls, ac):
         '''
@@ -351,12 +444,8 @@ class HTTPBundleLoader(Loader):
         binfo = self._index.get(bundle_id)
         if binfo:
             if bundle_version is None:
-                for binfo_version, versioned_binfo in binfo.items():
-                    try:
-                        int(binfo_version)
-                    except ValueError:
-                        L.warning("Got unexpected non-version-number key '%s' in bundle index info", binfo_version)
-                        continue
+                for _, binfo_version in self._bundle_version_keys(bundle_id):
+                    versioned_binfo = binfo[binfo_version]
                     try:
                         binfo_url = versioned_binfo.get('url')
                     except AttributeError:
@@ -389,19 +478,33 @@ class HTTPBundleLoader(Loader):
 
     def bundle_versions(self, bundle_id):
         self._setup_index()
-        binfo = self._index.get(bundle_id)
+        return [vn for vn, _ in self._bundle_version_keys(bundle_id)]
 
-        if not binfo:
-            return []
+    def _bundle_version_keys(self, bundle_id):
+        '''
+        Get the versions of a bundle listed in the index, sorted in ascending order.
 
-        res = []
-        for k in binfo.keys():
-            try:
-                val = int(k)
-            except ValueError:
-                L.warning("Got unexpected non-version-number key '%s' in bundle index info", k)
-            else:
-                res.append(val)
+        The index must be set up already. The versions for each bundle are only parsed
+        once per loader.
+
+        Returns
+        -------
+        list of tuple(int, str)
+            The version numbers paired with the corresponding keys in the index
+        '''
+        res = self._version_keys.get(bundle_id)
+        if res is None:
+            res = []
+            binfo = self._index.get(bundle_id)
+            if isinstance(binfo, dict):
+                for k in binfo.keys():
+                    # Checking first is cheaper than handling the ValueError from `int`
+                    if k.isdecimal():
+                        res.append((int(k), k))
+                    else:
+                        L.warning("Got unexpected non-version-number key '%s' in bundle index info", k)
+            res.sort()
+            self._version_keys[bundle_id] = res
         return res
 
     def load(self, bundle_id, bundle_version=None):
@@ -423,18 +526,10 @@ class HTTPBundleLoader(Loader):
             raise LoadFailed(bundle_id, self, 'Unexpected type of bundle info in the index')
 
         if bundle_version is None:
-            max_vn = 0
-            for k in binfo.keys():
-                try:
-                    val = int(k)
-                except ValueError:
-                    L.warning("Got unexpected non-version-number key '%s' in bundle index info", k)
-                else:
-                    if max_vn < val:
-                        max_vn = val
-            if not max_vn:
+            version_keys = self._bundle_version_keys(bundle_id)
+            if not version_keys or version_keys[-1][0] <= 0:
                 raise LoadFailed(bundle_id, self, 'No releases found')
-            bundle_version = max_vn
+            bundle_version = version_keys[-1][0]
 
         versioned_binfo = binfo.get(str(bundle_version))
 
@@ -477,31 +572,20 @@ class HTTPBundleLoader(Loader):
             raise LoadFailed('Received HTTP error from bundle server') from e
 
         if self.cachedir is not None:
-            bfn = urlquote(bundle_id)
-            with open(p(self.cachedir, bfn), 'wb') as f:
-                no_content = True
-                for chunk in response.iter_content(chunk_size=1024):
-                    no_content = False
-                    hsh.update(chunk)
-                    f.write(chunk)
-
-                if no_content:
-                    raise LoadFailed(bundle_id, self,
-                            f'Failed to load bundle for version {bundle_version}: no content')
-            digest = hsh.hexdigest()
-            if bundle_hash != digest:
-                raise LoadFailed(bundle_id, self,
-                        f'Failed to verify {hash_name} hash for version {bundle_version}: '
-                        f'Expected {bundle_hash} but got {digest}')
-            with open(p(self.cachedir, bfn), 'rb') as f:
-                Unarchiver().unpack(f, self.base_directory)
+            # We keep the cached file open for unpacking after we've checked the hash
+            # rather than opening it again
+            archive = open(p(self.cachedir, urlquote(bundle_id)), 'w+b')
         else:
-            bio = io.BytesIO()
+            # We have to get the whole archive to check the hash before we unpack it, but
+            # there's no need to hold a large one in memory
+            archive = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+
+        with archive:
             no_content = True
-            for chunk in response.iter_content(chunk_size=1024):
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                 no_content = False
                 hsh.update(chunk)
-                bio.write(chunk)
+                archive.write(chunk)
             if no_content:
                 raise LoadFailed(bundle_id, self,
                         f'Failed to load bundle for version {bundle_version}: no content')
@@ -510,8 +594,8 @@ class HTTPBundleLoader(Loader):
                 raise LoadFailed(bundle_id, self,
                         f'Failed to verify {hash_name} hash for version {bundle_version}: '
                         f'Expected {bundle_hash} but got {digest}')
-            bio.seek(0)
-            Unarchiver().unpack(bio, self.base_directory)
+            archive.seek(0)
+            Unarchiver().unpack(archive, self.base_directory)
 
 
 class HTTPBundleUploader(Uploader):
@@ -563,9 +647,25 @@ class HTTPBundleUploader(Uploader):
         '''
         Attempt to upload the bundle. Retries will be attempted when `BrokenPipeError` is
         thrown by the http client
+
+        If `bundle_path` is a directory, then the archive is created in memory, unless
+        it's larger than `ARCHIVE_SPOOL_SIZE`, rather than being written to a file first
         '''
-        with ensure_archive(bundle_path) as archive_path:
-            self._post(archive_path)
+        if isdir(bundle_path):
+            with tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE) as archive:
+                Archiver(None).write(archive, bundle_path)
+                self._post(archive)
+        else:
+            with open(bundle_path, 'rb') as archive:
+                # We don't really care about the TAR file being properly formatted here --
+                # it's up to the server to tell us it can't process the bundle. We just
+                # check if it's a TAR file for the convenience of the user. We check with
+                # the file we're about to send rather than opening it separately.
+                try:
+                    tarfile.open(fileobj=archive).close()
+                except tarfile.TarError:
+                    raise NotABundlePath(bundle_path, 'Expected a directory or a tar file')
+                self._post(archive)
 
     def _post(self, archive):
         parsed_url = urlparse(self.upload_url)
@@ -575,22 +675,27 @@ class HTTPBundleUploader(Uploader):
             def connection_ctor(*args, **kwargs):
                 return http.client.HTTPSConnection(*args,
                         context=self.ssl_context, **kwargs)
-        conn = connection_ctor(parsed_url.netloc)
-        with open(archive, 'rb') as f:
-            retries = 0
-            completed = False
-            while not completed:
-                try:
-                    conn.request("POST", "", body=f,
-                            headers={'Content-Type': BUNDLE_ARCHIVE_MIME_TYPE})
-                    completed = True
-                except (BrokenPipeError, ssl.SSLEOFError):
-                    if retries >= self.max_retries:
-                        raise
-                    L.warn('Failed to upload bundle to %s. Will retry %d more times.',
-                            self.upload_url, self.max_retries - retries, exc_info=True)
-                    conn = connection_ctor(parsed_url.netloc)
-                    retries += 1
+        conn = connection_ctor(parsed_url.netloc, blocksize=UPLOAD_BLOCK_SIZE)
+        # Giving the length up front lets us send the archive as-is rather than with
+        # chunked transfer encoding
+        archive_size = archive.seek(0, os.SEEK_END)
+        headers = {'Content-Type': BUNDLE_ARCHIVE_MIME_TYPE,
+                   'Content-Length': str(archive_size)}
+        retries = 0
+        completed = False
+        while not completed:
+            try:
+                # Start from the beginning in case we're retrying
+                archive.seek(0)
+                conn.request("POST", "", body=archive, headers=headers)
+                completed = True
+            except (BrokenPipeError, ssl.SSLEOFError):
+                if retries >= self.max_retries:
+                    raise
+                L.warn('Failed to upload bundle to %s. Will retry %d more times.',
+                        self.upload_url, self.max_retries - retries, exc_info=True)
+                conn = connection_ctor(parsed_url.netloc, blocksize=UPLOAD_BLOCK_SIZE)
+                retries += 1
         # XXX: Do something with this response
         # conn.getresponse()
 
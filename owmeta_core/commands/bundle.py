@@ -10,6 +10,11 @@ from os import makedirs, unlink, getcwd, rename
 from urllib.parse import urlparse
 
 import yaml
+try:
+    from yaml import CFullLoader as _YAMLFullLoader
+except ImportError:
+    # PyYAML was built without libyaml
+    from yaml import FullLoader as _YAMLFullLoader
 
 from ..context import DEFAULT_CONTEXT_KEY, IMPORTS_CONTEXT_KEY
 from ..mapper import CLASS_REGISTRY_CONTEXT_KEY
@@ -439,7 +444,7 @@ class OWMBundle(object):
             return self._parse_descriptor(f)
 
     def _parse_descriptor(self, fh):
-        return Descriptor.make(yaml.full_load(fh))
+        return Descriptor.make(yaml.load(fh, Loader=_YAMLFullLoader))
 
     def _register_bundle(self, descr, file_name):
         try:
@@ -1,8 +1,19 @@
+import shutil
+
+try:
+    from hashlib import file_digest as _file_digest
+except ImportError:
+    # Python < 3.11
+    _file_digest = None
+
+
 def hash_file(hsh, fname, blocksize=None):
     '''
     Updates the given hash object with the contents of a file.
 
     The file is read in `blocksize` chunks to avoid eating up too much memory at a time.
+    If no `blocksize` is given and `hashlib.file_digest` is available, the file is read
+    by that instead.
 
     Parameters
     ----------
@@ -14,12 +25,50 @@ def hash_file(hsh, fname, blocksize=None):
         The number of bytes to read at a time. If not provided, will use
         `hsh.block_size <hashlib.hash.block_size>` instead.
     '''
+    with open(fname, 'rb') as fh:
+        if not blocksize and _file_digest is not None:
+            _file_digest(fh, lambda: hsh)
+            return
+
+        if not blocksize:
+            blocksize = hsh.block_size
+
+        buf = memoryview(bytearray(blocksize))
+        while True:
+            size = fh.readinto(buf)
+            if not size:
+                break
+            hsh.update(buf[:size])
+
+
+def hash_and_copy_file(hsh, source_fname, dest_fname, blocksize=None):
+    '''
+    Updates the given hash object with the contents of a file while copying it to another
+    file.
+
+    The source is only read once, so this is cheaper than calling `hash_file` followed by
+    `shutil.copy2`. File metadata is copied like `shutil.copy2` does.
+
+    Parameters
+    ----------
+    hsh : `hashlib.hash <hashlib>`
+        The hash object to update
+    source_fname : str
+        The filename for the file to hash and copy
+    dest_fname : str
+        The filename to copy to
+    blocksize : int, optional
+        The number of bytes to read at a time. If not provided, will use a multiple of
+        `hsh.block_size <hashlib.hash.block_size>` instead.
+    '''
     if not blocksize:
-        blocksize = hsh.block_size
+        blocksize = hsh.block_size << 15
 
-    with open(fname, 'rb') as fh:
+    with open(source_fname, 'rb') as src, open(dest_fname, 'wb') as dst:
         while True:
-            block = fh.read(blocksize)
+            block = src.read(blocksize)
             if not block:
                 break
             hsh.update(block)
+            dst.write(block)
+    shutil.copystat(source_fname, dest_fname)
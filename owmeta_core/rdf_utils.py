@@ -125,10 +125,18 @@ def transitive_lookup(graph, start, predicate, context=None, direction=DOWN, see
 
 
 class BatchAddGraph(object):
-    ''' Wrapper around graph that turns calls to 'add' into calls to 'addN' '''
+    '''
+    Wrapper around graph that turns calls to 'add' into calls to 'addN'
+
+    While a `BatchAddGraph` is entered as a context manager, the graphs returned by
+    `get_context` add to its batch rather than their own, so triples for many small
+    contexts are written with a few large 'addN' calls instead of at least one per
+    context. The batch is flushed when the outer `BatchAddGraph` exits.
+    '''
     def __init__(self, graph, batchsize=1000, _parent=None, *args, **kwargs):
         self.graph = graph
         self.g = (graph,)
+        self._entered = False
         if _parent:
             self.batch = _parent.batch
             self.batchsize = _parent.batchsize
@@ -156,21 +164,31 @@ class BatchAddGraph(object):
         else:
             self._count = value
 
+    @property
+    def _pooled(self):
+        return self._parent is not None and self._parent._entered
+
     def add(self, triple):
-        if self.count > 0 and self.count % self.batchsize == 0:
-            self.graph.addN(self.batch)
-            self.batch = []
+        holder = self._parent if self._pooled else self
+        if len(holder.batch) >= self.batchsize:
+            holder.graph.addN(holder.batch)
+            holder.batch = []
         self.count += 1
-        self.batch.append(triple + self.g)
+        holder.batch.append(triple + self.g)
 
     def get_context(self, ctx):
         return BatchAddGraph(self.graph.get_context(ctx), _parent=self)
 
     def __enter__(self):
-        self.reset()
+        if not self._pooled:
+            self.reset()
+            self._entered = True
         return self
 
     def __exit__(self, *exc):
+        if not self._entered:
+            return
+        self._entered = False
         if exc[0] is None:
             self.graph.addN(self.batch)
 
@@ -6,6 +6,7 @@ elsewhere in owmeta_core
 import functools
 import importlib
 import re
+from itertools import islice
 
 __all__ = ['grouper', 'slice_dict']
 
@@ -20,17 +21,16 @@ PROVIDER_PATH_RE = re.compile(PROVIDER_PATH_FORMAT, flags=re.VERBOSE)
 def grouper(iterable, n, fillvalue=None):
     "Collect data into fixed-length chunks or blocks"
     # grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx
-    args = [iter(iterable)] * n
+    it = iter(iterable)
     while True:
-        l = []
-        try:
-            for x in args:
-                l.append(next(x))
-        except Exception:
-            pass
-        yield l
-        if len(l) < n:
+        chunk = list(islice(it, n))
+        if not chunk:
             break
+        if len(chunk) < n:
+            chunk.extend([fillvalue] * (n - len(chunk)))
+            yield chunk
+            break
+        yield chunk
 
 
 def slice_dict(d, s):
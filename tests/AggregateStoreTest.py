@@ -0,0 +1,346 @@
+import threading
+from unittest.mock import patch
+
+from pytest import raises
+from rdflib import plugin
+from rdflib.graph import Graph
+from rdflib.store import Store, NO_STORE
+from rdflib.term import URIRef
+
+from owmeta_core.agg_store import AggregateStore, AggregatedStoresConflict
+
+
+CTX = URIRef('http://example.org/ctx')
+CTX1 = URIRef('http://example.org/ctx1')
+
+
+def trip(n):
+    return (URIRef('http://example.org/s%d' % n),
+            URIRef('http://example.org/p'),
+            URIRef('http://example.org/o%d' % n))
+
+
+def make_store(n=2):
+    agg = AggregateStore()
+    agg.open([('Memory', None)] * n)
+    return agg
+
+
+def test_triples_single_store():
+    agg = make_store(1)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    assert [trip(0)] == [t for t, _ in agg.triples((None, None, None))]
+
+
+def test_triples_multiple_stores():
+    agg = make_store(2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(1), context=Graph(identifier=CTX1))
+    assert {trip(0), trip(1)} == set(t for t, _ in agg.triples((None, None, None)))
+
+
+def test_triples_choices_multiple_stores():
+    agg = make_store(2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(1), context=Graph(identifier=CTX1))
+    res = set(t for t, _ in agg.triples_choices(
+        ([trip(0)[0], trip(1)[0]], None, None)))
+    assert {trip(0), trip(1)} == res
+
+
+def test_contexts_deduplicated():
+    agg = make_store(2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(1), context=Graph(identifier=CTX))
+    assert [CTX] == [c.identifier if hasattr(c, 'identifier') else c
+                     for c in agg.contexts()]
+
+
+def test_namespaces_includes_bound():
+    agg = make_store(2)
+    agg.bind('ex', URIRef('http://example.org/'))
+    agg.stores[1].bind('ex1', URIRef('http://example.org/1/'))
+    nss = set(agg.namespaces())
+    assert ('ex', URIRef('http://example.org/')) in nss
+    assert ('ex1', URIRef('http://example.org/1/')) in nss
+
+
+def test_prefix_from_aggregated_store():
+    agg = make_store(2)
+    agg.stores[1].bind('ex1', URIRef('http://example.org/1/'))
+    assert 'ex1' == agg.prefix(URIRef('http://example.org/1/'))
+    assert URIRef('http://example.org/1/') == agg.namespace('ex1')
+
+
+def test_prefix_conflict():
+    agg = make_store(2)
+    agg.stores[0].bind('ex0', URIRef('http://example.org/1/'))
+    agg.stores[1].bind('ex1', URIRef('http://example.org/1/'))
+    with raises(AggregatedStoresConflict):
+        agg.prefix(URIRef('http://example.org/1/'))
+
+
+def test_bind_overrides_cached_prefix():
+    agg = make_store(2)
+    assert agg.prefix(URIRef('http://example.org/1/')) is None
+    agg.bind('ex', URIRef('http://example.org/1/'))
+    assert 'ex' == agg.prefix(URIRef('http://example.org/1/'))
+
+
+def test_prefix_after_store_bound_directly():
+    agg = make_store(2)
+    assert agg.prefix(URIRef('http://example.org/1/')) is None
+    assert [] == [ns for ns in agg.namespaces() if ns[0] == 'ex1']
+    agg.stores[1].bind('ex1', URIRef('http://example.org/1/'))
+    assert 'ex1' == agg.prefix(URIRef('http://example.org/1/'))
+    assert URIRef('http://example.org/1/') == agg.namespace('ex1')
+    assert ('ex1', URIRef('http://example.org/1/')) in set(agg.namespaces())
+
+
+def test_bind_no_override():
+    agg = make_store(1)
+    agg.bind('ex', URIRef('http://example.org/1/'))
+    agg.bind('ex', URIRef('http://example.org/2/'), override=False)
+    assert URIRef('http://example.org/1/') == agg.namespace('ex')
+
+
+def test_open_error_propagates():
+    agg = AggregateStore()
+    with patch('rdflib.plugins.stores.memory.Memory.open', side_effect=OSError('fail')):
+        with raises(OSError):
+            agg.open([('Memory', None)] * 2)
+
+
+def test_open_error_closes_opened_stores():
+    agg = AggregateStore()
+    with patch('rdflib.plugins.stores.memory.Memory.open',
+               side_effect=[None, OSError('fail')]), \
+            patch('rdflib.plugins.stores.memory.Memory.close') as close:
+        with raises(OSError):
+            agg.open([('Memory', None)] * 3)
+    close.assert_called_once()
+
+
+def test_open_concurrently_error_closes_opened_stores():
+    agg = AggregateStore(max_workers=2)
+    opens = iter([None, OSError('fail')])
+
+    def open_store(conf):
+        res = next(opens)
+        if isinstance(res, Exception):
+            raise res
+
+    with patch('rdflib.plugins.stores.memory.Memory.open', side_effect=open_store), \
+            patch('rdflib.plugins.stores.memory.Memory.close') as close:
+        with raises(OSError):
+            agg.open([('Memory', None)] * 2)
+    close.assert_called_once()
+
+
+def test_open_sequential_by_default():
+    agg = AggregateStore()
+    with patch('owmeta_core.agg_store.ThreadPoolExecutor') as tpe:
+        agg.open([('Memory', None)] * 2)
+    tpe.assert_not_called()
+
+
+def test_len_sequential_by_default():
+    agg = make_store(2)
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX))
+    with patch('owmeta_core.agg_store.ThreadPoolExecutor') as tpe:
+        assert 1 == len(agg)
+    tpe.assert_not_called()
+
+
+def test_len_concurrent_with_max_workers():
+    agg = AggregateStore(max_workers=2)
+    agg.open([('Memory', None)] * 3)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[2].add(trip(1), context=Graph(identifier=CTX))
+    assert 2 == len(agg)
+
+
+def test_bulk_add_to_first_store():
+    agg = make_store(2)
+    ctx = Graph(identifier=CTX)
+    agg.bulk_add((trip(n) for n in range(5)), ctx, batch_size=2)
+    assert 5 == len(list(agg.stores[0].triples((None, None, None), context=ctx)))
+    assert 0 == len(list(agg.stores[1].triples((None, None, None))))
+
+
+def test_len_sums_stores():
+    agg = make_store(3)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[2].add(trip(1), context=Graph(identifier=CTX))
+    agg.stores[2].add(trip(2), context=Graph(identifier=CTX))
+    assert 3 == len(agg)
+
+
+def test_namespaces_deduplicated():
+    agg = make_store(2)
+    agg.stores[0].bind('ex', URIRef('http://example.org/'))
+    agg.stores[1].bind('ex', URIRef('http://example.org/'))
+    nss = list(agg.namespaces())
+    assert 1 == nss.count(('ex', URIRef('http://example.org/')))
+
+
+def test_len_updated_after_add():
+    agg = make_store(2)
+    ctx = Graph(identifier=CTX)
+    assert 0 == len(agg)
+    agg.add(trip(0), context=ctx)
+    assert 1 == len(agg)
+    agg.remove(trip(0), context=ctx)
+    assert 0 == len(agg)
+
+
+def test_len_updated_after_store_changed_directly():
+    agg = make_store(2)
+    assert 0 == len(agg)
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX))
+    assert 1 == len(agg)
+
+
+def test_triples_parallel():
+    agg = AggregateStore(max_workers=2)
+    agg.open([('Memory', None)] * 3)
+    for n in range(3):
+        for m in range(10):
+            agg.stores[n].add(trip(n * 10 + m), context=Graph(identifier=CTX))
+    res = [t for t, _ in agg.triples((None, None, None))]
+    assert set(trip(n) for n in range(30)) == set(res)
+    assert 30 == len(res)
+    agg.close()
+
+
+def test_triples_parallel_early_close():
+    agg = AggregateStore(max_workers=2)
+    agg.open([('Memory', None)] * 2)
+    for n in range(2000):
+        agg.stores[n % 2].add(trip(n), context=Graph(identifier=CTX))
+    it = agg.triples((None, None, None))
+    next(it)
+    it.close()
+    agg.close()
+
+
+def test_triples_parallel_nested_query():
+    '''
+    A query made while another is suspended (e.g., in a join) must not wait on the
+    suspended query's workers
+    '''
+    agg = AggregateStore(max_workers=2)
+    agg.open([('Memory', None)] * 2)
+    ctx = Graph(identifier=CTX)
+    for n in range(20000):
+        agg.stores[n % 2].add(trip(n), context=ctx)
+    outer = agg.triples((None, None, None))
+    (s, _, _), _ = next(outer)
+    res = []
+    t = threading.Thread(target=lambda: res.extend(agg.triples((s, None, None))),
+                         daemon=True)
+    t.start()
+    t.join(10)
+    assert not t.is_alive()
+    assert 1 == len(res)
+    outer.close()
+    agg.close()
+
+
+def test_triples_parallel_error():
+    agg = AggregateStore(max_workers=2)
+    agg.open([('Memory', None)] * 2)
+    with patch.object(agg.stores[1], 'triples', side_effect=KeyError('oops')):
+        with raises(KeyError):
+            list(agg.triples((None, None, None)))
+    agg.close()
+
+
+def test_prefix_conflict_not_strict():
+    agg = AggregateStore(strict_prefix_check=False)
+    agg.open([('Memory', None)] * 2)
+    agg.stores[0].bind('ex0', URIRef('http://example.org/1/'))
+    agg.stores[1].bind('ex1', URIRef('http://example.org/1/'))
+    assert 'ex0' == agg.prefix(URIRef('http://example.org/1/'))
+
+
+def test_triples_choices_batched():
+    agg = make_store(2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(1), context=Graph(identifier=CTX1))
+    agg.stores[1].add(trip(2), context=Graph(identifier=CTX1))
+    with patch.object(agg.stores[0], 'triples_choices', wraps=agg.stores[0].triples_choices) as tc:
+        res = [t for t, _ in agg.triples_choices_batched([
+            (([trip(0)[0], trip(1)[0]], None, None), None),
+            (([trip(1)[0], trip(2)[0]], None, None), None),
+        ])]
+        assert 1 == tc.call_count
+    assert sorted([trip(0), trip(1), trip(2)]) == sorted(res)
+
+
+def test_triples_choices_batched_no_choices():
+    agg = make_store(2)
+    with raises(ValueError, match='no list of choices'):
+        list(agg.triples_choices_batched([((None, None, None), None)]))
+
+
+def test_triples_deduplicate():
+    agg = AggregateStore(deduplicate=True)
+    agg.open([('Memory', None)] * 2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX1))
+    agg.stores[1].add(trip(1), context=Graph(identifier=CTX1))
+    assert sorted([trip(0), trip(1)]) == sorted(t for t, _ in agg.triples((None, None, None)))
+
+
+def test_triples_no_deduplicate():
+    agg = make_store(2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX1))
+    assert [trip(0), trip(0)] == [t for t, _ in agg.triples((None, None, None))]
+
+
+def test_contexts_updated_after_add():
+    agg = make_store(2)
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX1))
+    assert [CTX1] == [c.identifier for c in agg.contexts()]
+    agg.add(trip(1), context=Graph(identifier=CTX))
+    assert {CTX, CTX1} == set(c.identifier for c in agg.contexts())
+
+
+def test_contexts_updated_after_store_changed_directly():
+    agg = make_store(2)
+    assert [] == list(agg.contexts())
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX1))
+    assert [CTX1] == [c.identifier for c in agg.contexts()]
+
+
+def test_options_from_open_configuration():
+    agg = plugin.get('agg', Store)()
+    agg.open({'stores': [('Memory', None)] * 2, 'deduplicate': True})
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    agg.stores[1].add(trip(0), context=Graph(identifier=CTX1))
+    assert [trip(0)] == [t for t, _ in agg.triples((None, None, None))]
+
+
+def test_open_configuration_without_stores():
+    assert NO_STORE == AggregateStore().open({'deduplicate': True})
+
+
+def test_route_by_predicate():
+    agg = AggregateStore(route_by_predicate=True)
+    agg.open([('Memory', None)] * 2)
+    agg.stores[0].add(trip(0), context=Graph(identifier=CTX))
+    with patch.object(agg.stores[1], 'triples', wraps=agg.stores[1].triples) as triples:
+        assert [trip(0)] == [t for t, _ in agg.triples((None, trip(0)[1], None))]
+        assert [trip(0)] == [t for t, _ in agg.triples((None, trip(0)[1], None))]
+        # Only probed for the predicate once
+        assert 1 == triples.call_count
+
+
+def test_route_by_predicate_updated_after_add():
+    agg = AggregateStore(route_by_predicate=True)
+    agg.open([('Memory', None)] * 2)
+    assert [] == list(agg.triples((None, trip(0)[1], None)))
+    agg.add(trip(0), context=Graph(identifier=CTX))
+    assert [trip(0)] == [t for t, _ in agg.triples((None, trip(0)[1], None))]
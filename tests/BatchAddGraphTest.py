@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from rdflib.graph import ConjunctiveGraph
+from rdflib.term import URIRef
+
+from owmeta_core.rdf_utils import BatchAddGraph
+
+
+def trip(n):
+    return (URIRef('http://example.org/s%d' % n),
+            URIRef('http://example.org/p'),
+            URIRef('http://example.org/o%d' % n))
+
+
+def ctx(n):
+    return URIRef('http://example.org/ctx%d' % n)
+
+
+def test_contexts_flush_on_exit():
+    g = ConjunctiveGraph()
+    bag = BatchAddGraph(g, batchsize=10)
+    with bag.get_context(ctx(0)) as cg:
+        cg.add(trip(0))
+    assert [trip(0)] == list(g.get_context(ctx(0)))
+
+
+def test_entered_pools_contexts():
+    g = ConjunctiveGraph()
+    with patch.object(g, 'addN', wraps=g.addN) as addN:
+        with BatchAddGraph(g, batchsize=100) as bag:
+            for n in range(5):
+                with bag.get_context(ctx(n)) as cg:
+                    cg.add(trip(n))
+        assert 1 == addN.call_count
+    for n in range(5):
+        assert [trip(n)] == list(g.get_context(ctx(n)))
+    assert 5 == bag.count
+
+
+def test_entered_flushes_full_batch():
+    g = ConjunctiveGraph()
+    with patch.object(g, 'addN', wraps=g.addN) as addN:
+        with BatchAddGraph(g, batchsize=2) as bag:
+            for n in range(5):
+                with bag.get_context(ctx(n)) as cg:
+                    cg.add(trip(n))
+        assert 3 == addN.call_count
+    assert 5 == len(g)
@@ -1,7 +1,10 @@
 import json
 import os
+import shutil
 from os.path import exists, join as p
+from subprocess import CalledProcessError
 import tarfile
+from unittest.mock import patch
 
 import pytest
 
@@ -104,3 +107,69 @@ def test_bundle_directory_path_returns_non_none(tempdir, test_bundle):
     s = Archiver(tempdir, test_bundle.bundles_directory).pack(
             bundle_directory=test_bundle.bundle_directory)
     assert s is not None
+
+
+def test_pack_readable_archive(tempdir, test_bundle):
+    s = Archiver(tempdir, test_bundle.bundles_directory).pack(
+            bundle_directory=test_bundle.bundle_directory)
+    with tarfile.open(s, 'r:xz') as tf:
+        assert BUNDLE_MANIFEST_FILE_NAME in tf.getnames()
+
+
+def test_pack_uses_lzma_by_default(tempdir, test_bundle):
+    with patch('owmeta_core.bundle.archive.Popen') as popen:
+        s = Archiver(tempdir, test_bundle.bundles_directory).pack(
+                bundle_directory=test_bundle.bundle_directory)
+    popen.assert_not_called()
+    with tarfile.open(s, 'r:xz') as tf:
+        assert BUNDLE_MANIFEST_FILE_NAME in tf.getnames()
+
+
+@pytest.mark.skipif(not shutil.which('xz'), reason='xz is not installed')
+def test_pack_readable_archive_with_xz_command(tempdir, test_bundle):
+    with patch('owmeta_core.bundle.archive.ARCHIVE_XZ_COMMAND', ('xz', '-T0')):
+        s = Archiver(tempdir, test_bundle.bundles_directory).pack(
+                bundle_directory=test_bundle.bundle_directory)
+    with tarfile.open(s, 'r:xz') as tf:
+        assert BUNDLE_MANIFEST_FILE_NAME in tf.getnames()
+
+
+def test_pack_readable_archive_without_xz_command(tempdir, test_bundle):
+    with patch('owmeta_core.bundle.archive.ARCHIVE_XZ_COMMAND', ('not-an-xz-command',)):
+        s = Archiver(tempdir, test_bundle.bundles_directory).pack(
+                bundle_directory=test_bundle.bundle_directory)
+    with tarfile.open(s, 'r:xz') as tf:
+        assert BUNDLE_MANIFEST_FILE_NAME in tf.getnames()
+
+
+def test_pack_xz_command_failure(tempdir, test_bundle):
+    with patch('owmeta_core.bundle.archive.ARCHIVE_XZ_COMMAND', ('false',)):
+        with pytest.raises(CalledProcessError):
+            Archiver(tempdir, test_bundle.bundles_directory).pack(
+                    bundle_directory=test_bundle.bundle_directory)
+
+
+def test_pack_relative_names_in_subdirectories(tempdir):
+    bundle_directory = p(tempdir, 'bundle')
+    os.makedirs(p(bundle_directory, 'files', 'sub'))
+    with open(p(bundle_directory, BUNDLE_MANIFEST_FILE_NAME), 'w') as f:
+        f.write('{}')
+    open(p(bundle_directory, 'files', 'sub', 'afile'), 'w').close()
+    s = Archiver(tempdir).pack(bundle_directory=bundle_directory + os.sep)
+    with tarfile.open(s, 'r:xz') as tf:
+        assert {BUNDLE_MANIFEST_FILE_NAME, p('files', 'sub', 'afile')} == set(tf.getnames())
+
+
+def test_pack_skips_indexed_db_directory(tempdir):
+    bundle_directory = p(tempdir, 'bundle')
+    os.makedirs(p(bundle_directory, BUNDLE_INDEXED_DB_NAME, 'sub'))
+    with open(p(bundle_directory, BUNDLE_MANIFEST_FILE_NAME), 'w') as f:
+        f.write('{}')
+    open(p(bundle_directory, BUNDLE_INDEXED_DB_NAME, 'sub', 'afile'), 'w').close()
+    with patch.object(Archiver, '_filter', wraps=Archiver(tempdir)._filter) as fltr:
+        s = Archiver(tempdir).pack(bundle_directory=bundle_directory)
+    with tarfile.open(s, 'r:xz') as tf:
+        assert [BUNDLE_MANIFEST_FILE_NAME] == tf.getnames()
+    # The filtered directory isn't walked
+    assert all(not c.args[0].startswith(p(BUNDLE_INDEXED_DB_NAME, ''))
+               for c in fltr.call_args_list)
@@ -1,3 +1,4 @@
+import json
 from owmeta_core.bundle import Cache
 from os.path import join as p
 from os import makedirs
@@ -36,3 +37,23 @@ def test_cache_list_empty_inconsistent_manifest_1(tempdir):
         f.write('{}')
     cut = Cache(tempdir)
     assert len(list(cut.list())) == 0
+
+
+def test_cache_list_newest_version_first(tempdir):
+    for version in (2, 10, 1):
+        bdir = p(tempdir, 'bdir', str(version))
+        makedirs(bdir)
+        with open(p(bdir, 'manifest'), 'w') as f:
+            json.dump(dict(id='bdir', version=version), f)
+    cut = Cache(tempdir)
+    assert [10, 2, 1] == [m['version'] for m in cut.list()]
+
+
+def test_cache_list_skips_non_version_directory(tempdir):
+    for name in ('notaversion', '3'):
+        bdir = p(tempdir, 'bdir', name)
+        makedirs(bdir)
+        with open(p(bdir, 'manifest'), 'w') as f:
+            json.dump(dict(id='bdir', version=3), f)
+    cut = Cache(tempdir)
+    assert [3] == [m['version'] for m in cut.list()]
@@ -281,6 +281,11 @@ def test_agg_with_readonly_FileStorageZODB_is_cacheable():
     assert _is_cacheable('agg', [['FileStorageZODB', {'read_only': True}]])
 
 
+def test_agg_with_options_and_readonly_FileStorageZODB_is_cacheable():
+    assert _is_cacheable('agg', {'stores': [['FileStorageZODB', {'read_only': True}]],
+                                 'deduplicate': True})
+
+
 def test_agg_with_writeable_FileStorageZODB_is_not_cacheable():
     assert not _is_cacheable('agg', [
         ['FileStorageZODB', '/tmp/blah_blah'],
@@ -1,3 +1,4 @@
+import io
 import os
 from os.path import join as p
 import json
@@ -178,3 +179,21 @@ def test_deploy_archive_manifest_emptyfile_not_a_bundle(tempdir):
     cut = Deployer()
     with raises(NotABundlePath):
         cut.deploy(bundle_path, remotes=(rem,))
+
+
+def test_deploy_archive_dot_slash_manifest(tempdir, remote):
+    '''
+    Archives may name the manifest "./manifest"
+    '''
+    bundle_path = p(tempdir, 'bundle.tar.xz')
+    manifest = json.dumps({'id': 'abundle', 'version': 1, 'manifest_version': 1}).encode()
+    with tarfile.open(bundle_path, 'w:xz') as tf:
+        tinfo = tarfile.TarInfo('./manifest')
+        tinfo.size = len(manifest)
+        tf.addfile(tinfo, io.BytesIO(manifest))
+        tf.addfile(tarfile.TarInfo('graphs'), io.BytesIO(b''))
+
+    cut = Deployer()
+    with patch('owmeta_core.bundle.validate_manifest') as vm:
+        cut.deploy(bundle_path, remotes=(remote,))
+    assert 'abundle' == vm.call_args[0][1]['id']
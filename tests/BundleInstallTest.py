@@ -1,4 +1,5 @@
 from collections import namedtuple
+import hashlib
 import json
 from os import listdir, makedirs
 from os.path import join as p, isdir, isfile
@@ -10,8 +11,9 @@ import pytest
 import rdflib
 from rdflib.term import URIRef
 
-from owmeta_core.bundle import (Installer, Descriptor, make_include_func, FilesDescriptor,
-                                UncoveredImports, DependencyDescriptor, TargetIsNotEmpty,
+from owmeta_core.bundle import (Installer, Descriptor, make_include_func, make_pattern,
+                                FilesDescriptor, UncoveredImports, DependencyDescriptor,
+                                TargetIsNotEmpty,
                                 Remote, Bundle, BUNDLE_MANIFEST_FILE_NAME)
 from owmeta_core.context import IMPORTS_CONTEXT_KEY
 from owmeta_core.mapper import CLASS_REGISTRY_CONTEXT_KEY
@@ -138,6 +140,60 @@ def test_no_dupe(dirs):
     assert len(graph_files) == 1
 
 
+def test_context_file_name_is_content_hash(dirs):
+    ctxid = 'http://example.org/ctx1'
+    d = Descriptor('test')
+    d.includes.add(make_include_func(ctxid))
+    g = rdflib.ConjunctiveGraph()
+    cg = g.get_context(ctxid)
+    with transaction.manager:
+        cg.add((aURI('a'), aURI('b'), aURI('c')))
+
+    bi = Installer(*dirs, graph=g)
+    bi.install(d)
+
+    graphs = p(dirs.bundles_directory, 'test', '1', 'graphs')
+    graph_files = [x for x in listdir(graphs) if x.endswith('.nt')]
+    assert graph_files
+    for fname in graph_files:
+        with open(p(graphs, fname), 'rb') as f:
+            assert hashlib.sha224(f.read()).hexdigest() + '.nt' == fname
+
+
+def test_context_patterns(dirs):
+    d = Descriptor('test')
+    d.patterns.add(make_pattern('http://example.org/ctx*'))
+    d.patterns.add(make_pattern('rgx:http://example.org/other(1|2)'))
+    g = rdflib.ConjunctiveGraph()
+    with transaction.manager:
+        for ctxid in ('ctx1', 'other1', 'other3'):
+            g.get_context('http://example.org/' + ctxid).add(
+                    (aURI(ctxid), aURI('b'), aURI('c')))
+
+    bi = Installer(*dirs, graph=g)
+    bi.install(d)
+
+    with open(p(dirs.bundles_directory, 'test', '1', 'graphs', 'index'), 'rb') as f:
+        ctxids = set(line.split(b'\x00')[0] for line in f.read().splitlines())
+    assert {b'http://example.org/ctx1', b'http://example.org/other1'} == ctxids
+
+
+def test_context_included_and_matched_written_once(dirs):
+    ctxid = 'http://example.org/ctx1'
+    d = Descriptor('test')
+    d.includes.add(make_include_func(ctxid))
+    d.patterns.add(make_pattern('http://example.org/ctx*'))
+    g = rdflib.ConjunctiveGraph()
+    with transaction.manager:
+        g.get_context(ctxid).add((aURI('a'), aURI('b'), aURI('c')))
+
+    bi = Installer(*dirs, graph=g)
+    bi.install(d)
+
+    with open(p(dirs.bundles_directory, 'test', '1', 'graphs', 'index'), 'rb') as f:
+        assert 1 == len(f.read().splitlines())
+
+
 def test_file_copy(dirs):
     d = Descriptor('test')
     open(p(dirs[0], 'somefile'), 'w').close()
@@ -186,6 +242,47 @@ def test_file_hash_content(dirs):
         assert b'somefile' in contents
 
 
+def test_file_copy_content_and_hash(dirs):
+    d = Descriptor('test')
+    content = bytes(range(256)) * 1000
+    with open(p(dirs[0], 'somefile'), 'wb') as f:
+        f.write(content)
+    d.files = FilesDescriptor()
+    d.files.includes.add('somefile')
+    bi = Installer(*dirs, graph=rdflib.ConjunctiveGraph())
+    bi.install(d)
+    bfiles = p(dirs.bundles_directory, 'test', '1', 'files')
+    with open(p(bfiles, 'somefile'), 'rb') as f:
+        assert content == f.read()
+    with open(p(bfiles, 'hashes'), 'rb') as f:
+        assert hashlib.sha224(content).digest() in f.read()
+
+
+def test_file_hashes_many_files(dirs):
+    d = Descriptor('test')
+    d.files = FilesDescriptor()
+    contents = {}
+    for i in range(20):
+        fname = 'somefile%d' % i
+        contents[fname] = (b'%d' % i) * 1000
+        with open(p(dirs[0], fname), 'wb') as f:
+            f.write(contents[fname])
+        d.files.includes.add(fname)
+    bi = Installer(*dirs, graph=rdflib.ConjunctiveGraph())
+    bi.install(d)
+    bfiles = p(dirs.bundles_directory, 'test', '1', 'files')
+    hashes = dict()
+    with open(p(bfiles, 'hashes'), 'rb') as f:
+        data = f.read()
+    while data:
+        fname, data = data.split(b'\x00', 1)
+        digest_size = data[0]
+        hashes[fname.decode('UTF-8')] = data[1:digest_size + 1]
+        data = data[digest_size + 2:]
+    assert {fname: hashlib.sha224(content).digest()
+            for fname, content in contents.items()} == hashes
+
+
 def test_uncovered_imports(dirs):
     '''
     If we have imports and no dependencies, then thrown an exception if we have not
@@ -315,6 +412,32 @@ def test_imports_in_dependencies(dirs):
     bi.install(d)
 
 
+def test_dependencies_not_looked_up_without_uncovered_imports(dirs):
+    '''
+    If all of the imports are covered by the bundle itself, then we don't need to look
+    at dependency contexts at all
+    '''
+    ctxid = 'http://example.org/ctx1'
+    d = Descriptor('test')
+    d.includes.add(make_include_func(ctxid))
+    d.dependencies.add(DependencyDescriptor('dep'))
+
+    g = rdflib.ConjunctiveGraph()
+    with transaction.manager:
+        g.get_context(ctxid).add((aURI('a'), aURI('b'), aURI('c')))
+
+    class StubBundle(object):
+        manifest_data = {'version': 1}
+
+        @property
+        def contexts(self):
+            pytest.fail('Should not have read the dependency contexts')
+
+    bi = Installer(*dirs, graph=g)
+    with patch.object(bi, '_dd_to_bundle', return_value=StubBundle()):
+        bi.install(d)
+
+
 def test_imports_in_unfetched_dependencies(dirs):
     '''
     If we have imports and a dependency includes the context, then we shouldn't have an
@@ -15,9 +15,11 @@ import transaction
 import ZODB
 
 from owmeta_core.context import Context
+from owmeta_core.mapper import CLASS_REGISTRY_CONTEXT_LIST_KEY
 from owmeta_core.contextualize import Contextualizable
 from owmeta_core.bundle import (Bundle, BundleNotFound, Descriptor, DependencyDescriptor,
-                                _RemoteHandlerMixin, make_include_func, NoRemoteAvailable,
+                                Fetcher, Remote, URLConfig, _RemoteHandlerMixin,
+                                make_include_func, make_pattern, NoRemoteAvailable,
                                 DEFAULT_BUNDLES_DIRECTORY, BundleDependencyManager)
 from owmeta_core.bundle.exceptions import CircularDependencyDetected
 from owmeta_core.bundle.common import (find_bundle_directory, BUNDLE_MANIFEST_FILE_NAME,
@@ -71,6 +73,29 @@ def test_specified_version_fetched(tempdir):
     assert expected == b._get_bundle_directory()
 
 
+def test_resolve_remembers_bundle_directory(tempdir):
+    bundles_directory = p(tempdir, 'bundles')
+    expected = p(bundles_directory, 'example', '1')
+    makedirs(expected)
+    b = Bundle('example', bundles_directory=bundles_directory)
+    with patch('owmeta_core.bundle.find_bundle_directory',
+            wraps=find_bundle_directory) as fbd:
+        assert expected == b.resolve()
+        assert expected == b.resolve()
+        assert 1 == fbd.call_count
+
+
+def test_resolve_after_version_change(tempdir):
+    bundles_directory = p(tempdir, 'bundles')
+    makedirs(p(bundles_directory, 'example', '1'))
+    expected = p(bundles_directory, 'example', '2')
+    makedirs(expected)
+    b = Bundle('example', version=1, bundles_directory=bundles_directory)
+    b.resolve()
+    b.version = 2
+    assert expected == b.resolve()
+
+
 def test_no_versioned_bundles(tempdir):
     bundles_directory = p(tempdir, 'bundles')
     makedirs(p(bundles_directory, 'example'))
@@ -140,6 +165,14 @@ def test_descriptor_dependency():
     assert DependencyDescriptor('dep4') in d.dependencies
 
 
+def test_descriptor_repeated_dependency_kept_once_in_order():
+    d = Descriptor.make({
+        'id': 'testBundle',
+        'dependencies': ['dep2', ('dep1', 1), 'dep2', {'id': 'dep1', 'version': 1}]
+    })
+    assert [DependencyDescriptor('dep2'), DependencyDescriptor('dep1', 1)] == d.dependencies
+
+
 def test_descriptor_includes_extra_key():
     with pytest.raises(ValueError, match=r'.*empty.*'):
         Descriptor.load('''
@@ -160,6 +193,13 @@ def test_descriptor_empties():
     assert 'http://example.org/empty_ctx' in d.empties
 
 
+def test_descriptor_empties_does_not_modify_source():
+    includes = [{'http://example.org/empty_ctx': {'empty': True}}]
+    d = Descriptor.make({'id': 'dep', 'includes': includes})
+    assert 'http://example.org/empty_ctx' in d.empties
+    assert [{'http://example.org/empty_ctx': {'empty': True}}] == includes
+
+
 def test_descriptor_includes_empty_false():
     d = Descriptor.load('''
     id: dep
@@ -170,6 +210,39 @@ def test_descriptor_includes_empty_false():
     assert not d.empties
 
 
+def test_include_func_strips_whitespace():
+    inc = make_include_func(' http://example.org/ctx ')
+    assert inc(URIRef('http://example.org/ctx'))
+    assert inc('http://example.org/ctx\n')
+    assert not inc(URIRef('http://example.org/ctx1'))
+
+
+def test_glob_pattern_matches_uri_prefix():
+    pat = make_pattern('http://example.org/*/ctx?')
+    assert pat(URIRef('http://example.org/a/ctx1'))
+    assert pat(URIRef('http://example.org/a/ctx12'))
+    assert pat(URIRef('http://example.org/a/ctx'))
+    assert not pat(URIRef('http://example.org/a/other'))
+
+
+def test_glob_pattern_negated_class():
+    pat = make_pattern('http://example.org/ctx[!2]')
+    assert pat(URIRef('http://example.org/ctx1'))
+    assert not pat(URIRef('http://example.org/ctx2'))
+
+
+def test_descriptors_share_patterns_and_include_funcs():
+    '''
+    Descriptors with the same patterns and includes share the objects made from them
+    '''
+    data = {'id': 'a', 'patterns': ['rgx:http://example.org/.*'],
+            'includes': ['http://example.org/ctx', {'http://example.org/ctx1': {}}]}
+    d1 = Descriptor.make(data)
+    d2 = Descriptor.make(data)
+    assert d1.patterns == d2.patterns
+    assert d1.includes == d2.includes
+
+
 def test_triple_in_dependency(custom_bundle):
     dep_desc = Descriptor.load('''
     id: dep
@@ -438,6 +511,43 @@ def test_bundle_retrieve_remotes_default_dir(tempdir):
         retrieve_remotes.assert_called_with(remotes_dir)
 
 
+def test_fetcher_reuses_remote_loaders(tempdir):
+    remote = Remote('remote')
+    loader = Mock()
+    loader.can_load.return_value = True
+    with patch.object(remote, 'generate_loaders', return_value=iter([loader])) as gl:
+        cut = Fetcher(tempdir, [remote])
+        assert [loader] == list(cut._get_bundle_loaders('bundle_id', 1, None))
+        assert [loader] == list(cut._get_bundle_loaders('other_bundle_id', 1, None))
+        gl.assert_called_once()
+
+
+def test_fetcher_reuses_loaders_for_reread_remote(tempdir):
+    loader = Mock()
+    loader.can_load.return_value = True
+    with patch('owmeta_core.bundle.Remote.generate_loaders',
+               side_effect=lambda: iter([loader])) as gl:
+        cut = Fetcher(tempdir, [])
+        cut.remotes = [Remote('remote', [URLConfig('http://example.org/a')])]
+        list(cut._get_bundle_loaders('bundle_id', 1, None))
+        cut.remotes = [Remote('remote', [URLConfig('http://example.org/a')])]
+        list(cut._get_bundle_loaders('bundle_id', 1, None))
+        assert 1 == gl.call_count
+
+
+def test_fetcher_regenerates_loaders_for_changed_remote(tempdir):
+    loader = Mock()
+    loader.can_load.return_value = True
+    with patch('owmeta_core.bundle.Remote.generate_loaders',
+               side_effect=lambda: iter([loader])) as gl:
+        cut = Fetcher(tempdir, [])
+        cut.remotes = [Remote('remote', [URLConfig('http://example.org/a')])]
+        list(cut._get_bundle_loaders('bundle_id', 1, None))
+        cut.remotes = [Remote('remote', [URLConfig('http://example.org/b')])]
+        list(cut._get_bundle_loaders('bundle_id', 1, None))
+        assert 2 == gl.call_count
+
+
 class ContextWithNoId(Context):
     def __eq__(self, other):
         return isinstance(other, Context) and other.identifier is None
@@ -585,6 +695,49 @@ def test_bundle_store_conf_with_two_levels_excludes(custom_bundle):
                 ]))]
 
 
+def test_bundle_store_conf_shared_dependency_looked_up_once(custom_bundle):
+    '''
+    Test that a dependency reached through more than one view is only looked up in the
+    bundles directory once while building the store config
+    '''
+    d = Descriptor('test')
+    d.dependencies.add(DependencyDescriptor('dep', excludes=('http://example.org/ctx1',)))
+    d.dependencies.add(DependencyDescriptor('dep_dep'))
+
+    dep_d = Descriptor('dep')
+    dep_d.dependencies.add(DependencyDescriptor('dep_dep'))
+
+    dep_dep_d = Descriptor('dep_dep')
+    dep_dep_d.includes.add(make_include_func('http://example.org/ctx2'))
+
+    g = rdflib.ConjunctiveGraph()
+    g.get_context('http://example.org/ctx2').add((aURI('d'), aURI('e'), aURI('f')))
+
+    with custom_bundle(dep_dep_d, graph=g) as depdepbun, \
+            custom_bundle(dep_d, bundles_directory=depdepbun.bundles_directory) as depbun, \
+            custom_bundle(d, bundles_directory=depbun.bundles_directory) as testbun, \
+            patch('owmeta_core.bundle.find_bundle_directory',
+                    wraps=find_bundle_directory) as fbd, \
+            Bundle('test', bundles_directory=testbun.bundles_directory,
+                    conf={CLASS_REGISTRY_CONTEXT_LIST_KEY: []}):
+        assert 1 == sum(1 for c in fbd.call_args_list if c.args[1] == 'dep_dep')
+
+
+def test_bundle_null_dependencies_in_manifest(custom_bundle):
+    d = Descriptor('test')
+    with custom_bundle(d) as testbun:
+        manifest_fname = p(testbun.bundle_directory, BUNDLE_MANIFEST_FILE_NAME)
+        with open(manifest_fname) as mf:
+            manifest_data = json.load(mf)
+        manifest_data['dependencies'] = None
+        with open(manifest_fname, 'w') as mf:
+            json.dump(manifest_data, mf)
+
+        with Bundle('test', bundles_directory=testbun.bundles_directory) as bnd:
+            assert () == bnd.dependencies()
+            assert [('FileStorageZODB', ANY)] == bnd.conf['rdf.store_conf']
+
+
 def aURI(c):
     return URIRef(f'http://example.org/uri#{c}')
 
@@ -599,6 +752,22 @@ def test_find_bundle_directory_pathlib(tmpdir):
     assert find_bundle_directory(path, 'example/aBundle', 23) == bdir
 
 
+def test_find_bundle_directory_latest_version(tmpdir):
+    basedir = p(tmpdir, 'bundles')
+    for name in ('2', '10', 'notaversion', '-1'):
+        makedirs(p(basedir, 'example%2FaBundle', name))
+    open(p(basedir, 'example%2FaBundle', '20'), 'w').close()
+    assert p(basedir, 'example%2FaBundle', '10') == find_bundle_directory(basedir,
+            'example/aBundle')
+
+
+def test_find_bundle_directory_no_versions(tmpdir):
+    basedir = p(tmpdir, 'bundles')
+    makedirs(p(basedir, 'example%2FaBundle', 'notaversion'))
+    with pytest.raises(BundleNotFound):
+        find_bundle_directory(basedir, 'example/aBundle')
+
+
 def test_bundle_tree_file_ignore_ignores_indexed_db(tmpdir):
     ignore = BundleTreeFileIgnorer(tmpdir)
     dir_contents = [BUNDLE_INDEXED_DB_NAME, BUNDLE_INDEXED_DB_NAME + '.tmp', BUNDLE_MANIFEST_FILE_NAME]
@@ -660,3 +829,25 @@ def test_transitive_dep_cycle_detection(custom_bundle):
                 dependencies=lambda: [{'id': 'dep', 'version': 1}])
         with pytest.raises(CircularDependencyDetected):
             list(cut.load_dependencies_transitive())
+
+
+def test_transitive_dep_topological_order():
+    graph = {
+        'a': ['c', 'b'],
+        'b': ['d'],
+        'c': ['b', 'd'],
+        'd': [],
+    }
+    bundles = {}
+
+    def fake_bundle(ident):
+        bnd = bundles.get(ident)
+        if bnd is None:
+            bnd = Mock(ident=ident, version=1)
+            bnd.load_dependencies.side_effect = lambda: [fake_bundle(d) for d in graph[ident]]
+            bundles[ident] = bnd
+        return bnd
+
+    cut = BundleDependencyManager(dependencies=lambda: [])
+    with patch.object(cut, 'load_dependencies', side_effect=lambda: [fake_bundle('a')]):
+        assert ['a', 'c', 'b', 'd'] == [b.ident for b in cut.load_dependencies_transitive()]
@@ -1,12 +1,14 @@
 from io import BytesIO
-from os import makedirs
+from os import listdir, makedirs, symlink
 from os.path import isdir, join as p
 import json
 import tarfile
 
 from owmeta_core.bundle.archive import (Unarchiver,
+                                        ArchiveExtractor,
                                         TargetDirectoryMismatch,
-                                        UnarchiveFailed)
+                                        UnarchiveFailed,
+                                        _BadArchiveFilePath)
 from owmeta_core.bundle import fmt_bundle_directory
 from owmeta_core.bundle.exceptions import NotABundlePath
 
@@ -198,6 +200,50 @@ def test_unpack_fail_message_on_unnamed_fileobj_missing_manifest(tempdir):
         Unarchiver(tempdir).unpack(bio)
 
 
+def test_extractor_rejects_sibling_with_target_prefix(tempdir):
+    '''
+    A path into a sibling directory whose name starts with the target directory's name is
+    still outside of the target directory
+    '''
+    target = p(tempdir, 'a')
+    with _member_tarfile(tempdir, '../ab/invalid_file') as tf:
+        with pytest.raises(_BadArchiveFilePath):
+            ArchiveExtractor(target, tf).extract()
+
+
+def test_extractor_follows_existing_symlink(tempdir):
+    '''
+    A path through a symlink already in the target directory is resolved before checking
+    '''
+    target = p(tempdir, 'target')
+    makedirs(target)
+    makedirs(p(tempdir, 'outside'))
+    symlink(p(tempdir, 'outside'), p(target, 'link'))
+    with _member_tarfile(tempdir, 'link/invalid_file') as tf:
+        with pytest.raises(_BadArchiveFilePath):
+            ArchiveExtractor(target, tf).extract()
+
+
+def test_extractor_extracts_all_members_of_fresh_tarfile(tempdir):
+    '''
+    The extractor reads members as it goes, so it does not need the archive to have been
+    scanned before extracting
+    '''
+    with tarfile.open(p(tempdir, 'members.tar'), 'w') as tf:
+        for name in ('a', 'b', 'c'):
+            tf.addfile(tarfile.TarInfo(name), fileobj=BytesIO(b''))
+    target = p(tempdir, 'target')
+    with tarfile.open(p(tempdir, 'members.tar')) as tf:
+        ArchiveExtractor(target, tf).extract()
+    assert ['a', 'b', 'c'] == sorted(listdir(target))
+
+
+def _member_tarfile(tempdir, name):
+    with tarfile.open(p(tempdir, 'members.tar'), 'w') as tf:
+        tf.addfile(tarfile.TarInfo(name), fileobj=BytesIO(b''))
+    return tarfile.open(p(tempdir, 'members.tar'))
+
+
 def _write_archive(tempdir, manifest_contents, *files):
     manifest_contents = json.dumps(manifest_contents).encode('UTF-8')
     with tarfile.open(p(tempdir, 'file_name'), 'w:xz') as f:
@@ -0,0 +1,36 @@
+import hashlib
+from os.path import join as p
+from unittest.mock import patch
+
+from owmeta_core.file_utils import hash_file
+
+
+CONTENT = bytes(range(256)) * 100
+
+
+def test_hash_file(tempdir):
+    fname = p(tempdir, 'somefile')
+    with open(fname, 'wb') as f:
+        f.write(CONTENT)
+    hsh = hashlib.sha224()
+    hash_file(hsh, fname)
+    assert hashlib.sha224(CONTENT).digest() == hsh.digest()
+
+
+def test_hash_file_blocksize(tempdir):
+    fname = p(tempdir, 'somefile')
+    with open(fname, 'wb') as f:
+        f.write(CONTENT)
+    hsh = hashlib.sha224()
+    hash_file(hsh, fname, blocksize=1000)
+    assert hashlib.sha224(CONTENT).digest() == hsh.digest()
+
+
+def test_hash_file_without_file_digest(tempdir):
+    fname = p(tempdir, 'somefile')
+    with open(fname, 'wb') as f:
+        f.write(CONTENT)
+    hsh = hashlib.sha224()
+    with patch('owmeta_core.file_utils._file_digest', None):
+        hash_file(hsh, fname)
+    assert hashlib.sha224(CONTENT).digest() == hsh.digest()
@@ -1,5 +1,8 @@
 from contextlib import contextmanager
 import hashlib
+import json
+from os import listdir
+from os.path import join as p
 from unittest.mock import patch, ANY
 import re
 
@@ -110,6 +113,26 @@ def test_bundle_versions_skips_non_int():
         assert set(cut.bundle_versions('test_bundle')) == set([1, 2])
 
 
+def test_bundle_versions_sorted():
+    with successful_get({'test_bundle': {
+            '10': 'http://some_host',
+            '2': 'http://some_host',
+            '1': 'http://some_host'}}):
+        cut = HTTPBundleLoader('index_url')
+        assert [1, 2, 10] == cut.bundle_versions('test_bundle')
+
+
+def test_bundle_versions_parsed_once(caplog):
+    with successful_get({'test_bundle': {
+            '1': 'http://some_host',
+            'oops': 'http://some_host'}}):
+        cut = HTTPBundleLoader('index_url')
+        cut.bundle_versions('test_bundle')
+        cut.bundle_versions('test_bundle')
+        cut.can_load('test_bundle')
+    assert 1 == sum(1 for m in caplog.messages if 'oops' in m)
+
+
 def test_load_fail_no_info():
     with successful_get({}):
         cut = HTTPBundleLoader('index_url')
@@ -148,9 +171,9 @@ def test_index_missing_url(bundle_archive):
 
 
 def test_load_no_cachedir():
-    from io import BytesIO
     bundle_contents = b'bytes bytes bytes'
     bundle_hash = hashlib.sha224(bundle_contents).hexdigest()
+    unpacked = []
 
     with successful_get({'test_bundle': {'1': {'url': 'http://some_host',
                                                'hashes': {'sha224': bundle_hash}}}}) as get, \
@@ -158,9 +181,11 @@ def test_load_no_cachedir():
         cut = HTTPBundleLoader('index_url')
         cut.base_directory = 'bdir'
 
+        # The archive is only available for reading during the call to unpack
+        Unarchiver().unpack.side_effect = lambda f, target: unpacked.append((f.read(), target))
         get().iter_content.return_value = [bundle_contents]
         cut.load('test_bundle')
-        Unarchiver().unpack.assert_called_with(MatchingBytesIO(BytesIO(b'bytes bytes bytes')), 'bdir')
+        assert [(b'bytes bytes bytes', 'bdir')] == unpacked
 
 
 def test_load_no_cachedir_no_content():
@@ -198,6 +223,50 @@ def test_load_cachedir_no_content(bundle_archive, tempdir):
             cut.load('test_bundle')
 
 
+def test_cachedir_index_revalidated(tempdir):
+    index = {'test_bundle': {'1': {'url': 'http://some_host',
+                                   'hashes': {'sha224': 'doesnt_matter'}}}}
+    with successful_get(index) as get:
+        get().headers = {'ETag': '"v1"'}
+        assert [1] == HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+
+        get().status_code = 304
+        get().json.side_effect = AssertionError('The cached index should be used')
+        assert [1] == HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        get.assert_called_with('index_url', headers={'If-None-Match': '"v1"'})
+
+
+def test_cachedir_index_not_cached_without_validator(tempdir):
+    with successful_get({'test_bundle': {'1': {}}}) as get:
+        HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        get.assert_called_with('index_url', headers={})
+
+
+@pytest.mark.parametrize('cached', ([], {'etag': '"v1"'}, {'etag': 1, 'index': {}}))
+def test_cachedir_malformed_cached_index_ignored(tempdir, cached):
+    with successful_get({'test_bundle': {'1': {}}}) as get:
+        get().headers = {'ETag': '"v1"'}
+        HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        cache_fname, = (p(tempdir, n) for n in listdir(tempdir))
+        with open(cache_fname, 'w') as f:
+            json.dump(cached, f)
+
+        assert [1] == HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        get.assert_called_with('index_url', headers={})
+
+
+def test_cachedir_index_replaced_without_leftover_files(tempdir):
+    with successful_get({'test_bundle': {'1': {}}}) as get:
+        get().headers = {'ETag': '"v1"'}
+        HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        get().headers = {'ETag': '"v2"'}
+        HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        HTTPBundleLoader('index_url', cachedir=tempdir).bundle_versions('test_bundle')
+        get.assert_called_with('index_url', headers={'If-None-Match': '"v2"'})
+    assert 1 == len(listdir(tempdir))
+
+
 def test_load_urlconfig():
     cut = HTTPBundleLoader(URLConfig('index_url'))
     assert cut.index_url == 'index_url'
@@ -208,12 +277,5 @@ def successful_get(body):
     with patch('owmeta_core.bundle.loaders.http.requests') as requests:
         requests.Session().get().json.return_value = body
         requests.Session().get().status_code = 200
+        requests.Session().get().headers = {}
         yield requests.Session().get
-
-
-class MatchingBytesIO(object):
-    def __init__(self, bio):
-        self.bio = bio
-
-    def __eq__(self, other):
-        return self.bio.getvalue() == other.getvalue()
@@ -1,17 +1,48 @@
+import io
+import os
 from os.path import join as p
 import logging
+import tarfile
 from unittest.mock import patch
 import re
 
 import pytest
 
 from owmeta_core.bundle.common import BUNDLE_ARCHIVE_MIME_TYPE
+from owmeta_core.bundle.exceptions import NotABundlePath
 from owmeta_core.bundle.loaders.http import HTTPBundleUploader, HTTPSURLConfig
 
 
 L = logging.getLogger(__name__)
 
 
+def body_reading_handler(server_data):
+    '''
+    The default server handler responds to a POST without reading the request body, so
+    the client can get a `BrokenPipeError` if the server closes the connection before the
+    whole archive is sent. We read the body here to avoid that.
+    '''
+    class _Handler(server_data.basic_handler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            self.handle_request(201)
+    return _Handler
+
+
+@pytest.fixture
+def http_server(http_server):
+    http_server.make_server(body_reading_handler)
+    http_server.restart()
+    yield http_server
+
+
+@pytest.fixture
+def https_server(https_server):
+    https_server.make_server(body_reading_handler)
+    https_server.restart()
+    yield https_server
+
+
 def test_bundle_upload_directory(http_server, tempdir):
     '''
     Uploading a directory requires that we turn it into an archive first.
@@ -31,37 +62,37 @@ def test_bundle_upload_directory(http_server, tempdir):
 
 @pytest.fixture
 def mocked_upload_client(tempdir):
-    testfile = p(tempdir, 'random_file')
-    with open(testfile, 'w') as f:
+    contents = p(tempdir, 'contents')
+    with open(contents, 'w') as f:
         f.write("smashing")
-    with patch('owmeta_core.bundle.loaders.http.http.client') as hc, \
-            patch('owmeta_core.bundle.loaders.http.ensure_archive') as mock_ensure_archive:
-        mock_ensure_archive().__enter__.return_value = testfile
+    with tarfile.open(p(tempdir, 'random_file'), 'w:xz') as tf:
+        tf.add(contents, arcname='contents')
+    with patch('owmeta_core.bundle.loaders.http.http.client') as hc:
         hc.HTTPConnection().request.side_effect = BrokenPipeError
         yield hc
 
 
-def test_bundle_upload_broken_pipe_default_one_retry(mocked_upload_client):
+def test_bundle_upload_broken_pipe_default_one_retry(mocked_upload_client, tempdir):
     cut = HTTPBundleUploader('http://fakeyfakeurl')
 
     with pytest.raises(BrokenPipeError):
-        cut(None)
+        cut(p(tempdir, 'random_file'))
     mocked_upload_client.HTTPConnection().request.call_count == 2
 
 
-def test_bundle_upload_broken_pipe_with_retry(mocked_upload_client):
+def test_bundle_upload_broken_pipe_with_retry(mocked_upload_client, tempdir):
     cut = HTTPBundleUploader('http://fakeyfakeurl', max_retries=3)
 
     with pytest.raises(BrokenPipeError):
-        cut(None)
+        cut(p(tempdir, 'random_file'))
     assert mocked_upload_client.HTTPConnection().request.call_count == 4
 
 
-def test_bundle_upload_broken_pipe_with_retry_logs(mocked_upload_client, caplog):
+def test_bundle_upload_broken_pipe_with_retry_logs(mocked_upload_client, caplog, tempdir):
     cut = HTTPBundleUploader('http://fakeyfakeurl', max_retries=3)
 
     with pytest.raises(BrokenPipeError):
-        cut(None)
+        cut(p(tempdir, 'random_file'))
 
     retry_logs = []
     for r in caplog.messages:
@@ -112,3 +143,36 @@ def test_bundle_upload_archive(http_server, bundle_archive):
         req = http_server.requests.get()
 
     assert req['headers']['content-type'] == BUNDLE_ARCHIVE_MIME_TYPE
+
+
+def test_bundle_upload_directory_sends_archive(tempdir):
+    '''
+    The archive for a directory is created in memory rather than in a file, so check that
+    what gets sent is a complete archive
+    '''
+    os.mkdir(p(tempdir, 'bundle'))
+    with open(p(tempdir, 'bundle', 'random_file'), 'w') as f:
+        f.write("smashing")
+    bodies = []
+
+    def request(method, url, body, headers):
+        bodies.append((body.read(), headers))
+
+    with patch('owmeta_core.bundle.loaders.http.http.client') as hc:
+        hc.HTTPConnection().request.side_effect = request
+        HTTPBundleUploader('http://fakeyfakeurl')(p(tempdir, 'bundle'))
+
+    body, headers = bodies[0]
+    assert str(len(body)) == headers['Content-Length']
+    with tarfile.open(fileobj=io.BytesIO(body), mode='r:xz') as tf:
+        assert ['random_file'] == tf.getnames()
+
+
+def test_bundle_upload_not_an_archive(tempdir):
+    with open(p(tempdir, 'random_file'), 'w') as f:
+        f.write("smashing")
+
+    with patch('owmeta_core.bundle.loaders.http.http.client') as hc:
+        with pytest.raises(NotABundlePath):
+            HTTPBundleUploader('http://fakeyfakeurl')(p(tempdir, 'random_file'))
+        hc.HTTPConnection().request.assert_not_called()
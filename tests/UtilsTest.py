@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 import unittest
-from owmeta_core.utils import ellipsize
+from owmeta_core.utils import ellipsize, grouper
 
 
 class EllipsizeTest(unittest.TestCase):
@@ -28,3 +28,25 @@ class EllipsizeTest(unittest.TestCase):
     def test_truncate(self):
         t = 'some random string'
         self.assertEqual(ellipsize(t, 0), '')
+
+
+class GrouperTest(unittest.TestCase):
+
+    def test_fill_last(self):
+        self.assertEqual(list(grouper('ABCDEFG', 3, 'x')),
+                [['A', 'B', 'C'], ['D', 'E', 'F'], ['G', 'x', 'x']])
+
+    def test_exact_multiple(self):
+        self.assertEqual(list(grouper('ABCDEF', 3)),
+                [['A', 'B', 'C'], ['D', 'E', 'F']])
+
+    def test_empty(self):
+        self.assertEqual(list(grouper('', 3)), [])
+
+    def test_error_propagates(self):
+        def gen():
+            yield 1
+            raise KeyError('oops')
+
+        with self.assertRaises(KeyError):
+            list(grouper(gen(), 3))